@@ -12,6 +12,7 @@ If V is root of DFST, then V is an articulation point iff V has
 more than one child. Else, V is an articulation point iff V has
 some child W s.t. low(W) >= num(V).
 """
+from array import array
 from shortpath import Graph, Vertex
 
 FIG9_62 = { 'A' : {'B':1, 'D':1},
@@ -23,48 +24,126 @@ FIG9_62 = { 'A' : {'B':1, 'D':1},
             'G' : {'C':1} }
 
 
-def dfs(G, V, depth=1):
-    """Perform DFS on graph G at vertex V and determine
-    if V and its adjacent vertices are articulation points
-    by calculating and comparing V.num and V.low.
-    Returns a list of articulation points of graph G.
+def biconnected_components(num_verts, edges, roots=None):
+    """Find articulation points, bridges and biconnected components of
+    an undirected graph on integer vertex ids in one iterative DFS.
 
-    G : Graph instance
-    V : Vertex instance
-    depth : depth of DFST.
+    num_verts : number of vertices, ids are 0..num_verts-1
+    edges : sequence of (u, v) pairs; parallel edges and self loops
+            are allowed
+    roots : vertex ids to start DFS trees from, in order (default all
+            vertices in id order), so disconnected graphs are covered
+
+    Returns (art_points, bridges, labels): articulation point ids and
+    bridge edge indices, both in the order the DFS finishes them, and
+    labels[e], the biconnected component id of edge e. A self loop
+    forms a component of its own.
+
+    The graph is stored as a flat CSR array with an edge index per
+    slot; the edge a vertex was reached by is skipped by index, so
+    parallel edges count as cycles. Each vertex keeps a cursor into
+    its adjacency, and tree and back edges are pushed on an edge stack
+    that is cut into a component whenever low(W) >= num(V) for a child
+    W of V.
+
+    >>> edges = [(0, 1), (1, 2), (2, 0), (2, 3), (3, 4), (4, 5), (5, 3),
+    ...          (5, 6)]
+    >>> art, bridges, labels = biconnected_components(7, edges)
+    >>> art, bridges
+    ([5, 3, 2], [7, 3])
+    >>> labels
+    [3, 3, 3, 2, 1, 1, 1, 0]
+    >>> biconnected_components(3, [(0, 1), (0, 1), (1, 2), (2, 2)])
+    ([1], [2], [1, 1, 0, 2])
     """
-    # update vertex attributes
-    V.visited = True
-    V.num = depth
-    V.low = V.num        # for now
-    V.child_count = 0    # useful for depth == 1 only
-    
-    # find num(adj) and low(adj) for all adj
-    # also find all articulation points among descendents of V
+    # CSR adjacency: slots indptr[v]..indptr[v+1] hold the neighbours
+    # of v and the index of the edge leading there
+    indptr = array('l', [0]) * (num_verts + 1)
+    for u, v in edges:
+        indptr[u+1] += 1
+        indptr[v+1] += 1
+    for v in xrange(num_verts):
+        indptr[v+1] += indptr[v]
+    heads = array('l', [0]) * indptr[num_verts]
+    eids = array('l', [0]) * indptr[num_verts]
+    pos = indptr[:num_verts]
+    for e, (u, v) in enumerate(edges):
+        heads[pos[u]] = v; eids[pos[u]] = e; pos[u] += 1
+        heads[pos[v]] = u; eids[pos[v]] = e; pos[v] += 1
+    del pos
+
+    num = [0] * num_verts            # DFS discovery number, 0 if unseen
+    low = [0] * num_verts
+    parent_edge = [-1] * num_verts
+    cursor = list(indptr[:num_verts])
+    is_art = [False] * num_verts
+    labels = [-1] * len(edges)
     art_list = []
-    for adj in V.adj:
-        # get actual Vertex obj
-        adjV = G.vertices[adj]
-        # if adj not visited, then it is a child
-        if not adjV.visited:
-            V.child_count += 1
-            art_list.extend( dfs(G, adjV, depth+1) )
-        # update V.low
-        if adjV.num < V.num:         # e(V, adj) is back edge
-            V.low = min(V.low, adjV.num)
-        else:                        # adj is child
-            V.low = min(V.low, adjV.low)
-    # determine if V is articulation point
-    if depth == 1 and V.child_count > 1:
-        art_list.append(V.name)
-    elif depth > 1:
-        for adj in V.adj:
-            adjV = G.vertices[adj]
-            if adjV.low >= V.num:
-                art_list.append(V.name)
-                break
-    return art_list
-    
+    bridges = []
+    edge_stack = []
+    num_comps = 0
+    counter = 0
+    if roots is None:
+        roots = xrange(num_verts)
+    for root in roots:
+        if num[root]:
+            continue
+        counter += 1
+        num[root] = low[root] = counter
+        root_children = 0
+        stack = [root]
+        while stack:
+            v = stack[-1]
+            i = cursor[v]
+            if i < indptr[v+1]:
+                cursor[v] = i + 1
+                w = heads[i]; e = eids[i]
+                if e == parent_edge[v] or w == v:
+                    continue
+                if not num[w]:                   # tree edge
+                    if v == root:
+                        root_children += 1
+                    parent_edge[w] = e
+                    edge_stack.append(e)
+                    counter += 1
+                    num[w] = low[w] = counter
+                    stack.append(w)
+                elif num[w] < num[v]:            # back edge
+                    edge_stack.append(e)
+                    if num[w] < low[v]:
+                        low[v] = num[w]
+                # else: back edge already taken from the descendant w
+                continue
+            # All adjacent vertices of v are done
+            stack.pop()
+            if v == root:
+                if root_children > 1:
+                    art_list.append(v)
+                continue
+            if is_art[v]:
+                art_list.append(v)
+            p = stack[-1]
+            if low[v] < low[p]:
+                low[p] = low[v]
+            if low[v] >= num[p]:
+                # p separates the subtree of v: its edges form a component
+                pe = parent_edge[v]
+                while True:
+                    f = edge_stack.pop()
+                    labels[f] = num_comps
+                    if f == pe:
+                        break
+                num_comps += 1
+                if low[v] > num[p]:
+                    bridges.append(pe)
+                if p != root:
+                    is_art[p] = True
+    for e, (u, v) in enumerate(edges):
+        if u == v:
+            labels[e] = num_comps
+            num_comps += 1
+    return art_list, bridges, labels
+
 def art_points(G, S=None):
     """Find all articulation points for G.
     If S is given, it is to be the root of DF spanning tree.
@@ -80,10 +159,13 @@ def art_points(G, S=None):
     """
     if S is None:
         S = G.vertices.keys()[0]
-    for V in G.vertices:
-        G.vertices[V].visited = False
-    V = G.vertices[S]
-    return dfs(G, V)
+    # Number the vertices with S first so that it becomes the root
+    names = [S] + [V for V in G.vertices if V != S]
+    ids = dict((V, i) for i, V in enumerate(names))
+    edges = [(ids[V], ids[adj]) for V in names
+             for adj in G.vertices[V].adj if ids[V] < ids[adj]]
+    art_list, _, _ = biconnected_components(len(names), edges, [0])
+    return [names[v] for v in art_list]
     
 if __name__ == '__main__':
     import doctest
@@ -1,9 +1,8 @@
 #!/usr/bin/env python
 """
 Find an Euler circuit of a graph.
-
-Implementation is flawed: the algorithm may not visit all edges.
 """
+from array import array
 from graph import Vertex, Graph
 
 FIG9_70 = { 'v1': {'v3': 1, 'v4': 1},
@@ -19,70 +18,192 @@ FIG9_70 = { 'v1': {'v3': 1, 'v4': 1},
             'v11': {'v4': 1, 'v10': 1},
             'v12': {'v9': 1, 'v10': 1} }
 
-def euler_tour(G, Vs, Ve):
+def euler_path(num_verts, edges, directed=False, start=None):
+    """Hierholzer's algorithm on integer vertex ids.
+
+    num_verts : number of vertices, ids are 0..num_verts-1
+    edges : sequence of (u, v) pairs; parallel edges and self loops
+            are allowed
+    directed : whether edge (u, v) only leads from u to v
+    start : vertex to start from (default: the only possible start of
+            an Euler trail, or else the first vertex with an edge)
+
+    Returns a list of vertex ids that uses every edge exactly once. It
+    is a circuit (first == last) when all degrees are even (in-degree
+    equals out-degree when directed), or else a trail between the two
+    odd vertices (from the vertex with one more outgoing edge when
+    directed). ValueError is raised when neither exists.
+
+    Each vertex keeps a cursor into its CSR adjacency and a bitmap
+    marks used edges, so every slot is looked at once: O(n + m).
+    Neighbours are tried in the order of the edges.
+
+    >>> euler_path(4, [(0, 1), (1, 2), (2, 0), (2, 3), (3, 2)])
+    [0, 1, 2, 3, 2, 0]
+    >>> euler_path(3, [(0, 1), (1, 2), (2, 0), (0, 1)])
+    [0, 1, 2, 0, 1]
+    >>> euler_path(3, [(0, 1), (1, 2), (2, 0)], directed=True, start=1)
+    [1, 2, 0, 1]
+    >>> euler_path(3, [(0, 1), (0, 2)], directed=True)
+    Traceback (most recent call last):
+        ...
+    ValueError: no Euler trail: vertex 0 has in-degree 0 and out-degree 2
+    >>> euler_path(4, [(0, 1), (1, 0), (2, 3), (3, 2)])
+    Traceback (most recent call last):
+        ...
+    ValueError: no Euler trail: edges are not connected
+    """
+    # CSR adjacency with an edge index per slot
+    indptr = array('l', [0]) * (num_verts + 1)
+    outdeg = [0] * num_verts
+    indeg = [0] * num_verts
+    for u, v in edges:
+        outdeg[u] += 1
+        indeg[v] += 1
+        indptr[u+1] += 1
+        if not directed:
+            indptr[v+1] += 1
+    for v in xrange(num_verts):
+        indptr[v+1] += indptr[v]
+    heads = array('l', [0]) * indptr[num_verts]
+    eids = array('l', [0]) * indptr[num_verts]
+    cursor = array('l', indptr[:num_verts])
+    for e, (u, v) in enumerate(edges):
+        heads[cursor[u]] = v; eids[cursor[u]] = e; cursor[u] += 1
+        if not directed:
+            heads[cursor[v]] = u; eids[cursor[v]] = e; cursor[v] += 1
+
+    # Check degrees and pick the start vertex
+    if directed:
+        starts = [v for v in xrange(num_verts) if outdeg[v] > indeg[v]]
+        bad = [v for v in xrange(num_verts)
+               if abs(outdeg[v] - indeg[v]) > 1]
+        if bad or len(starts) > 1:
+            v = (bad + starts[1:])[0]
+            raise ValueError('no Euler trail: vertex %d has in-degree %d '
+                             'and out-degree %d' % (v, indeg[v], outdeg[v]))
+    else:
+        starts = [v for v in xrange(num_verts)
+                  if (indeg[v] + outdeg[v]) % 2]
+        if len(starts) > 2:
+            raise ValueError('no Euler trail: %d vertices of odd degree'
+                             % len(starts))
+    if start is None:
+        if starts:
+            start = starts[0]
+        elif edges:
+            start = edges[0][0]
+        else:
+            return []
+    elif starts and start not in starts:
+        raise ValueError('no Euler trail from vertex %d' % start)
+
+    cursor = indptr[:num_verts]
+    used = bytearray(len(edges))
+    path = []
+    stack = [start]
+    while stack:
+        v = stack[-1]
+        i = cursor[v]
+        end = indptr[v+1]
+        while i < end and used[eids[i]]:
+            i += 1
+        if i < end:
+            cursor[v] = i + 1
+            used[eids[i]] = 1
+            stack.append(heads[i])
+        else:
+            cursor[v] = i
+            path.append(stack.pop())
+    if len(path) != len(edges) + 1:
+        raise ValueError('no Euler trail: edges are not connected')
+    path.reverse()
+    return path
+
+def _euler(G, Vs, directed, error):
+    """Runs euler_path on Graph G, trying neighbours in sorted order.
+    Engine errors refer to integer ids, so they are raised as
+    ValueError(error) instead."""
+    names = sorted(G.vertices)
+    ids = dict((V, i) for i, V in enumerate(names))
+    edges = [(ids[V], ids[adj]) for V in names
+             for adj in sorted(G.vertices[V].adj)
+             if directed or ids[V] <= ids[adj]]
+    try:
+        path = euler_path(len(names), edges, directed, ids[Vs])
+    except ValueError:
+        raise ValueError(error)
+    return [names[v] for v in path] or [Vs]
+
+def euler_tour(G, Vs, Ve, directed=False):
     """
     Returns an Euler tour (i.e. beginning and ending vertices are
     different) of graph G.
 
-    G : instance of Graph
+    G : instance of Graph, not modified
     Vs : starting vertex
     Ve : ending vertex
+    directed : if False, G stores every edge in both directions
     return: a list of vertice names representing euler tour.
+
+    Raises ValueError if there is no Euler tour from Vs to Ve.
+
+    >>> G = Graph(FIG9_70)
+    >>> G.remove_edge('v1', 'v3'); G.remove_edge('v3', 'v1')
+    >>> euler_tour(G, 'v1', 'v3')
+    ['v1', 'v4', 'v10', 'v11', 'v4', 'v3', 'v2', 'v8', 'v9', 'v10', 'v12', 'v9', 'v3', 'v6', 'v9', 'v7', 'v10', 'v5', 'v4', 'v7', 'v3']
+    >>> euler_tour(G, 'v1', 'v2')
+    Traceback (most recent call last):
+        ...
+    ValueError: no Euler tour from v1 to v2
+    >>> euler_tour(G, 'v2', 'v3')
+    Traceback (most recent call last):
+        ...
+    ValueError: no Euler tour from v2 to v3
     """
     if Vs == Ve:
-        return euler_circuit(G, Vs)
-    verts = G.vertices
-    num_edges = G.num_edges()/2  # Assume undirected
-    if num_edges == 1:
-        return [Vs, Ve]
-    else:
-        adjs = verts[Vs].adj.keys()[0]
-        G.remove_edge(Vs, adjs)
-        # above line should precede below line because
-        # adjs may equal adje
-        adje = verts[Ve].adj.keys()[0]
-        G.remove_edge(Ve, adje)
-        return [Vs] + euler_tour(G, adjs, adje) + [Ve]
+        return euler_circuit(G, Vs, directed)
+    error = 'no Euler tour from %s to %s' % (Vs, Ve)
+    tour = _euler(G, Vs, directed, error)
+    if tour[-1] != Ve:
+        raise ValueError(error)
+    return tour
     
-def euler_circuit(G, V):
+def euler_circuit(G, V, directed=False):
     """
-    Returns an Euler circuit of graph G terminating at vertex V.
-    
-    The strategy is to remove two edges
-    attached to V to use as starting and ending edges. If these
-    two edges were attached to U and W, then next we find an Euler
-    tour from U and W. We only need to append the beginning and
-    ending vertices to Euler tour to find Euler circuit.
-    
-    Note:
-    1. Algorithm is intended only for undirected graphs.
-    2. Algorithm is intended only for graphs that have
-       Euler circuits.
+    Returns an Euler circuit of graph G starting and terminating at
+    vertex V, using Hierholzer's algorithm (see euler_path).
 
-    G : instance of Graph
+    G : instance of Graph, not modified
     V : vertex name
+    directed : if False, G stores every edge in both directions
     returns: a list of vertice names representing euler circuit.
+
+    Raises ValueError if G has no Euler circuit.
     
     >>> G = Graph(FIG9_70)
     >>> euler_circuit(G, 'v1')
-    ['v1', 'v3', 'v2', 'v8', 'v9', 'v3', 'v7', 'v4', 'v5', 'v10', 'v12', 'v9', 'v10', 'v11', 'v4', 'v10', 'v7', 'v9', 'v6', 'v3', 'v4', 'v1']
-    >>> G = Graph(FIG9_70)
+    ['v1', 'v3', 'v2', 'v8', 'v9', 'v10', 'v11', 'v4', 'v10', 'v12', 'v9', 'v3', 'v4', 'v5', 'v10', 'v7', 'v3', 'v6', 'v9', 'v7', 'v4', 'v1']
     >>> euler_circuit(G, 'v7')
-    ['v7', 'v9', 'v8', 'v2', 'v3', 'v4', 'v5', 'v10', 'v12', 'v9', 'v10', 'v11', 'v4', 'v7', 'v3', 'v9', 'v6', 'v3', 'v1', 'v4', 'v10', 'v7']
+    ['v7', 'v10', 'v11', 'v4', 'v1', 'v3', 'v2', 'v8', 'v9', 'v10', 'v12', 'v9', 'v3', 'v4', 'v10', 'v5', 'v4', 'v7', 'v3', 'v6', 'v9', 'v7']
+    >>> G.num_edges()
+    42
+    >>> euler_circuit(Graph({'a': {'b': 1}, 'b': {'c': 1}, 'c': {'a': 1}}),
+    ...               'b', directed=True)
+    ['b', 'c', 'a', 'b']
+    >>> euler_circuit(Graph({'a': {'b': 1}, 'b': {'a': 1, 'c': 1},
+    ...                      'c': {'b': 1}}), 'b')
+    Traceback (most recent call last):
+        ...
+    ValueError: no Euler circuit from b
     """
-    if len(G.vertices[V].adj) == 0:
-        return [V]
-    else:
-        verts = G.vertices
-        adj0 = verts[V].adj.keys()[0]
-        adj1 = verts[V].adj.keys()[1]
-        G.remove_edge(V, adj0)
-        G.remove_edge(V, adj1)
-        tour = euler_tour(G, adj0, adj1)
-        return [V] + tour + [V]
+    error = 'no Euler circuit from %s' % V
+    circuit = _euler(G, V, directed, error)
+    if circuit[-1] != V:
+        raise ValueError(error)
+    return circuit
     
 if __name__ == '__main__':
-    print "Implementation flawed!"
     import doctest
     doctest.testmod()
     
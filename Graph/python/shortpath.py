@@ -65,11 +65,29 @@ class Graph(object):
         return iter(self.vertices)
 
 
+class Handle(object):
+    """Reference to an entry of a PriorityQueue, returned by enqueue.
+    pos is the entry's index in the heap array, -1 once dequeued."""
+    __slots__ = ('key', 'pos')
+
+    def __init__(self, key, pos):
+        self.key = key
+        self.pos = pos
+
+    def __repr__(self):
+        return "<Handle: %r>" % (self.key,)
+
+
 class PriorityQueue(object):
-    """Simple list based priority queue
+    """Addressable binary heap based priority queue
+
+    enqueue returns a Handle for the new entry and change_key takes
+    either such a handle or the key itself (found through a dict from
+    key to handle, so this needs hashable keys). enqueue, dequeue and
+    change_key are O(log n).
 
     >>> queue = PriorityQueue()
-    >>> queue.enqueue(5); queue.enqueue(4); queue.enqueue(1)
+    >>> h5 = queue.enqueue(5); h4 = queue.enqueue(4); h1 = queue.enqueue(1)
     >>> queue
     <PriorityQueue: [1, 4, 5]>
     >>> queue.change_key(4, 2)
@@ -81,40 +99,111 @@ class PriorityQueue(object):
     2
     >>> queue
     <PriorityQueue: [5]>
+    >>> queue.change_key(h5, 0); queue.enqueue(3)
+    <Handle: 3>
+    >>> queue.dequeue(), queue.dequeue()
+    (0, 3)
+    >>> queue.change_key(h4, 1)
+    Traceback (most recent call last):
+        ...
+    KeyError: 'No such key'
     """
     
     def __init__(self, cmp=cmp):
         super(PriorityQueue, self).__init__()
         self.cmp = cmp
-        self.list = []
+        self.heap = []      # Handles in heap order
+        self.handles = {}   # key -> Handle
 
     def __repr__(self):
-        return "<PriorityQueue: %s>" % self.list
+        return "<PriorityQueue: %s>" % sorted([h.key for h in self.heap],
+                                              self.cmp)
 
     def __len__(self):
-        return len(self.list)
+        return len(self.heap)
 
     def enqueue(self, key):
-        """Add a new key"""
-        self.list.append(key)
-        self.sort()
+        """Add a new key, returns its Handle"""
+        handle = Handle(key, len(self.heap))
+        self.heap.append(handle)
+        self._remember(handle)
+        self._sift_up(handle.pos)
+        return handle
         
     def dequeue(self):
         """Return key at the head of the queue"""
-        return self.list.pop(0)
+        heap = self.heap
+        top = heap[0]
+        last = heap.pop()
+        if heap:
+            heap[0] = last
+            self._sift_down(0)
+        top.pos = -1
+        self._forget(top)
+        return top.key
 
     def change_key(self, key, newkey):
-        """Changes key to newkey."""
-        if key in self.list:
-            self.list.remove(key)
-            self.list.append(newkey)
-            self.sort()
+        """Changes key (a Handle or a key in the queue) to newkey."""
+        if isinstance(key, Handle):
+            handle = key
         else:
+            handle = self.handles.get(key)
+        if handle is None or handle.pos < 0:
             raise KeyError('No such key')
+        self._forget(handle)
+        handle.key = newkey
+        self._remember(handle)
+        self._sift_up(handle.pos)
+        self._sift_down(handle.pos)
                 
     def sort(self):
-        """Maintain heap invariant"""
-        self.list.sort(self.cmp)
+        """Restore heap invariant, e.g. after keys changed in place"""
+        for i in reversed(xrange(len(self.heap) // 2)):
+            self._sift_down(i)
+
+    def _remember(self, handle):
+        try:
+            self.handles[handle.key] = handle
+        except TypeError:
+            pass    # unhashable keys can only be changed by handle
+
+    def _forget(self, handle):
+        try:
+            if self.handles.get(handle.key) is handle:
+                del self.handles[handle.key]
+        except TypeError:
+            pass
+
+    def _sift_up(self, i):
+        heap, cmp = self.heap, self.cmp
+        handle = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if cmp(handle.key, heap[parent].key) >= 0:
+                break
+            heap[i] = heap[parent]
+            heap[i].pos = i
+            i = parent
+        heap[i] = handle
+        handle.pos = i
+
+    def _sift_down(self, i):
+        heap, cmp = self.heap, self.cmp
+        n = len(heap)
+        handle = heap[i]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and cmp(heap[child+1].key, heap[child].key) < 0:
+                child += 1
+            if cmp(heap[child].key, handle.key) >= 0:
+                break
+            heap[i] = heap[child]
+            heap[i].pos = i
+            i = child
+        heap[i] = handle
+        handle.pos = i
 
 def shortest_path(graph, s):
     """Single source shortest path.
@@ -122,6 +211,9 @@ def shortest_path(graph, s):
     graph : a graph with no negative edge weight
     s     : source vertex
 
+    Sets cost (and path, the previous vertex) on every vertex of graph
+    and returns graph.
+
     >>> shortest_path(Graph(FIG9_8), 'v1')
     <Graph:
      <v1: {'cost': 0, 'adj': {'v2': 2, 'v4': 1}, 'name': 'v1'}>
@@ -136,11 +228,12 @@ def shortest_path(graph, s):
 
     # set inital costs to INF except for s
     queue = PriorityQueue(lambda x,y: cmp(x.cost, y.cost))
+    handles = {}
     for v in graph:
         graph[v].cost = INF
-        queue.enqueue(graph[v])
     graph[s].cost = 0
-    queue.sort()
+    for v in graph:
+        handles[v] = queue.enqueue(graph[v])
 
     # relax each vertex
     while len(queue):
@@ -149,14 +242,17 @@ def shortest_path(graph, s):
             if graph[a].cost > graph[v].cost + weight:
                 graph[a].path = v
                 graph[a].cost = graph[v].cost + weight
-        queue.sort()
-        #print queue
-    print graph
+                queue.change_key(handles[a], graph[a])
+    return graph
 
 def prim(graph, s=None):
     """Find minimum spanning tree for undirected graph
     using Prim's algorithm with vertex s as root.
 
+    Vertices next to the tree are kept in a PriorityQueue keyed by
+    (weight of their lightest edge to the tree, name), lowered with
+    change_key when a lighter edge shows up.
+
     >>> prim(Graph(FIG9_48), 'v1')
     [('v1', 'v4'), ('v1', 'v2'), ('v4', 'v3'), ('v4', 'v7'), ('v7', 'v6'), ('v7', 'v5')]
     >>> prim(Graph(FIG9_48))
@@ -165,32 +261,33 @@ def prim(graph, s=None):
     if s is None:
         s = graph.vertices.keys()[0]
     span_tree = []                             # edges of resulting span tree
-    pq = []                                    # priority queue
+    pq = PriorityQueue()                       # (weight, vertex) keys
+    handles = {}                               # vertex -> Handle in pq
+    src = {}                                   # vertex -> tree end of its edge
     added = dict([(v, False) for v in graph])  # v added to span tree yet?
 
-    # add s to span tree
-    added[s] = True
-    for adj, weight in graph[s].adj.items():
-        heapq.heappush(pq, (weight, (adj, s)))
-
-    # greedily add shortest edges
-    while pq:
-        # get the next shortest edge
-        weight, (v, src) = heapq.heappop(pq)
-
-        # discard if edge is to an added vertex
-        if added[v]:
-            continue
-
+    # greedily add closest vertices, starting with s
+    v = s
+    while True:
         # add vertex to span tree
         added[v] = True
-        span_tree.append((src, v))
-        #print span_tree
+        if v != s:
+            span_tree.append((src[v], v))
 
-        # add all edges to adj vertices not already in span tree
+        # lower keys of adj vertices not already in span tree
         for adj, weight in graph[v].adj.items():
-            if not added[adj]:
-                heapq.heappush(pq, (weight, (adj, v)))
+            if added[adj]:
+                continue
+            if adj not in handles:
+                handles[adj] = pq.enqueue((weight, adj))
+                src[adj] = v
+            elif weight < handles[adj].key[0]:
+                pq.change_key(handles[adj], (weight, adj))
+                src[adj] = v
+
+        if not len(pq):
+            break
+        weight, v = pq.dequeue()
         
     return span_tree
 
@@ -3,11 +3,12 @@
 Implements all pairs shortest path algorithms.
 """
 from __future__ import division
-import copy
+import copy, os
+import cPickle as pickle
 from graph import Graph
 from sssp import Dijkstra, BellmanFord
 
-def FloydWarshall(G):
+def FloydWarshall(G, checkpointDir=None, checkpointEvery=1):
     """Floyd-Warshall's All pairs shortest path algorithm.
     
     Returns n x n shortest path lengthes array and a n x n largest interior
@@ -20,6 +21,10 @@ def FloydWarshall(G):
     Returns (None, None) if the algorithm detects any negative cycles
     in the graph structure.
 
+    If checkpointDir is given, the matrices are pickled to that
+    (existing) directory after every checkpointEvery iterations of k,
+    so that resumeFloydWarshall can continue an interrupted run.
+
     >>> G = Graph.loadFromFile('g0.txt', True)
     >>> G.numVerts, G.numEdges
     (4, 5)
@@ -45,22 +50,66 @@ def FloydWarshall(G):
         A0[i][i] = 0
     for eIdx, (v1, v2) in enumerate(G.edges):
         A0[v1][v2] = G.getEdgeCost(eIdx)
+    return _fwLoop(A0, A1, IntV, 0, checkpointDir, checkpointEvery)
+
+def resumeFloydWarshall(checkpointDir, checkpointEvery=None):
+    """Continues a FloydWarshall run from the last checkpoint saved in
+    checkpointDir and returns what FloydWarshall would have.
+
+    checkpointEvery defaults to the interval stored in the checkpoint.
+
+    >>> import shutil, tempfile
+    >>> tmp = tempfile.mkdtemp()
+    >>> G = Graph.loadFromFile('g0.txt', True)
+    >>> A, I = FloydWarshall(G, checkpointDir=tmp, checkpointEvery=3)
+    >>> n, k, Aprev, IntV, every = pickle.load(open(os.path.join(tmp, 'floydwarshall.pkl'), 'rb'))
+    >>> n, k, every
+    (4, 3, 3)
+    >>> resumeFloydWarshall(tmp) == (A, I)
+    True
+    >>> shutil.rmtree(tmp)
+    """
+    path = os.path.join(checkpointDir, 'floydwarshall.pkl')
+    with open(path, 'rb') as f:
+        numVerts, k, Aprev, IntV, every = pickle.load(f)
+    if checkpointEvery is None:
+        checkpointEvery = every
+    # Iteration k reads A0 if k is even and A1 otherwise
+    Aother = copy.deepcopy(Aprev)
+    if k % 2 == 0:
+        A0, A1 = Aprev, Aother
+    else:
+        A0, A1 = Aother, Aprev
+    return _fwLoop(A0, A1, IntV, k, checkpointDir, checkpointEvery)
+
+def _fwLoop(A0, A1, IntV, start, checkpointDir, checkpointEvery):
+    "Runs the FloydWarshall iterations k = start..n-1"
+    numVerts = len(IntV)
+    Acur = A1 if start % 2 else A0
     # Main loop
-    for k in xrange(G.numVerts):
+    for k in xrange(start, numVerts):
         if k % 2 == 0:
             Acur = A1; Aprev = A0
         else:
             Acur = A0; Aprev = A1
-        for i in xrange(G.numVerts):
-            for j in xrange(G.numVerts):
+        for i in xrange(numVerts):
+            for j in xrange(numVerts):
                 Pk = Aprev[i][k] + Aprev[k][j]
                 if Pk < Aprev[i][j]:
                     IntV[i][j] = k
                     Acur[i][j] = Pk
                 else:
                     Acur[i][j] = Aprev[i][j]
+        if checkpointDir is not None and (k + 1) % checkpointEvery == 0:
+            path = os.path.join(checkpointDir, 'floydwarshall.pkl')
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump((numVerts, k + 1, Acur, IntV, checkpointEvery), f,
+                            pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(path + '.tmp', path)
     # Check for negative cycles
-    for i in xrange(G.numVerts):
+    for i in xrange(numVerts):
         if Acur[i][i] < 0:
             return None, None
     return Acur, IntV
@@ -2,8 +2,11 @@
 """
 Clustering Alogirithms.
 """
-import heapq
+import heapq, tempfile
+import itertools as it
+import numpy as np
 from union import UnionFind
+from mst import EuclideanMST
 
 def MaxSpacing(numNodes, dists, k):
     """
@@ -39,6 +42,303 @@ def MaxSpacing(numNodes, dists, k):
         if uf.find(n1-1) != uf.find(n2-1):
             return dist, uf.asDict()
     
+def MaxSpacingSorted(numNodes, edges, k):
+    """
+    Max-spacing k-clustering over a stream of edges sorted by distance.
+
+    Same greedy algorithm as MaxSpacing, but edges are consumed from
+    an iterator in increasing order of distance instead of being
+    heapified in memory, so only the O(n) union-find is kept. Reading
+    stops at the first edge joining two of the final k clusters, whose
+    distance is the spacing.
+
+    numNodes : number of nodes
+    edges : iterable of tuples (d, n1, n2) sorted by d, where n1 and n2
+            are 1-based node index as in MaxSpacing; e.g. the output of
+            SortedEdgesFromFile
+    k : number of desired clusters
+
+    Returns (spacing, clusters) like MaxSpacing. spacing is None if the
+    edges run out before another pair of clusters could be joined.
+
+    >>> edges = iter(sorted([(1,1,2),(3,1,3),(2,2,3),(9,3,4),(5,2,4)]))
+    >>> spacing, clusters = MaxSpacingSorted(4, edges, 2)
+    >>> spacing
+    5
+    >>> clusters
+    {1: [0, 1, 2], 3: [3]}
+    >>> list(edges)
+    [(9, 3, 4)]
+    """
+    uf = UnionFind(numNodes)
+    for dist, n1, n2 in edges:
+        s1 = uf.find(n1-1)
+        s2 = uf.find(n2-1)
+        if s1 != s2:
+            if uf.numSets <= k:
+                return dist, uf.asDict()
+            uf.union(s1, s2)
+    return None, uf.asDict()
+
+
+def SortedEdgesFromFile(datafile, chunkSize=1000000, cast=int):
+    """
+    Generates (d, n1, n2) tuples from an edge file in increasing order
+    of distance using an external merge sort.
+
+    Each row of the file must have 'N1 N2 D' format; a leading row with
+    a single number (the node count) and blank rows are skipped, any
+    other row raises an Exception. The file is read in chunks of
+    chunkSize rows, each chunk is sorted and spilled to a temporary
+    file, and the runs are merged lazily with heapq.merge, so memory
+    is O(chunkSize + number of runs).
+
+    cast : converts the distance field, e.g. int or float
+
+    >>> import os
+    >>> fd, path = tempfile.mkstemp()
+    >>> _ = os.write(fd, "3\\n1 3 3\\n1 2 1\\n2 3 2\\n")
+    >>> os.close(fd)
+    >>> list(SortedEdgesFromFile(path, chunkSize=2))
+    [(1, 1, 2), (2, 2, 3), (3, 1, 3)]
+    >>> MaxSpacingSorted(3, SortedEdgesFromFile(path), 2)
+    (2, {1: [0, 1], 2: [2]})
+    >>> list(SortedEdgesFromFile(path, chunkSize=1, cast=str))
+    [('1', 1, 2), ('2', 2, 3), ('3', 1, 3)]
+    >>> _ = open(path, 'a').write("4\\n")
+    >>> list(SortedEdgesFromFile(path))
+    Traceback (most recent call last):
+        ...
+    Exception: Invalid data
+    >>> os.remove(path)
+    """
+    def readRun(f):
+        for line in f:
+            d, n1, n2 = line.split()
+            yield cast(d), int(n1), int(n2)
+
+    runs = []
+    try:
+        chunk = []
+        f = open(datafile)
+        try:
+            for lineNo, line in enumerate(f):
+                parts = line.split()
+                if not parts or (lineNo == 0 and len(parts) == 1):
+                    continue
+                if len(parts) != 3:
+                    raise Exception, 'Invalid data'
+                n1, n2, d = parts
+                # Keep the distance text so that runs are written back
+                # exactly as read
+                chunk.append((cast(d), int(n1), int(n2), d))
+                if len(chunk) >= chunkSize:
+                    runs.append(_spill(chunk))
+                    chunk = []
+        finally:
+            f.close()
+        chunk.sort()
+        if not runs:
+            # Everything fit in one chunk; no need for temporary files
+            for edge in chunk:
+                yield edge[:3]
+            return
+        runs.append(_spill(chunk))
+        del chunk
+        for edge in heapq.merge(*[readRun(run) for run in runs]):
+            yield edge
+    finally:
+        for run in runs:
+            run.close()
+
+
+def _spill(chunk):
+    "Sorts chunk and writes it to an anonymous temporary file"
+    chunk.sort()
+    run = tempfile.TemporaryFile()
+    run.writelines("%s %d %d\n" % (text, n1, n2)
+                   for _, n1, n2, text in chunk)
+    run.seek(0)
+    return run
+
+def HammingClusters(codes, numBits=24, maxDist=2):
+    """
+    Clusters bit-vector nodes so that every pair of nodes within
+    Hamming distance maxDist ends up in the same cluster.
+
+    Instead of enumerating all n^2 pairs, every code is indexed in a
+    dict and each node looks up the codes obtained by flipping 1 to
+    maxDist of its bits, which is n * (C(bits,1) + ... + C(bits,maxDist))
+    dict lookups. Nodes with equal codes are at distance 0 and are
+    always merged.
+
+    codes : list of node labels as ints of numBits bits
+    numBits : number of bits in each label
+    maxDist : largest Hamming distance that must not separate nodes
+
+    Returns (numClusters, labels) where labels[i] is the cluster id of
+    node i. numClusters is the largest k for which a k-clustering has
+    spacing greater than maxDist.
+
+    >>> codes = [0b0000, 0b0001, 0b0011, 0b1100, 0b1111, 0b1100]
+    >>> HammingClusters(codes, numBits=4, maxDist=1)
+    (3, [1, 1, 1, 5, 4, 5])
+    >>> HammingClusters(codes, numBits=4, maxDist=2)[0]
+    1
+    """
+    uf = UnionFind(len(codes))
+    index = {}
+    for i, code in enumerate(codes):
+        first = index.setdefault(code, i)
+        if first != i:
+            uf.union(first, i)
+    masks = [sum(1 << b for b in bits)
+             for dist in xrange(1, maxDist+1)
+             for bits in it.combinations(xrange(numBits), dist)]
+    for code, i in index.iteritems():
+        for mask in masks:
+            j = index.get(code ^ mask)
+            if j is not None:
+                uf.union(i, j)
+    labels = [uf.find(i) for i in xrange(len(codes))]
+    return uf.numSets, labels
+
+def SingleLinkage(numNodes, edges):
+    """
+    Builds the single-linkage hierarchy of the nodes once, so that
+    clusterings for every k or distance threshold can be read off it.
+
+    Kruskal's algorithm is run over the edges; its i-th merge becomes
+    row i of Z in SciPy linkage format:
+    [cluster1, cluster2, distance, size of the merged cluster]
+    where clusters 0..n-1 are the nodes themselves and cluster n+i is
+    the one formed by row i. Passing only MST edges (n-1 of them) gives
+    the same hierarchy as the full distance list.
+
+    numNodes : number of nodes
+    edges : iterable of tuples (d, n1, n2) with 1-based node index,
+            in any order; it is not modified
+
+    Returns Z, an (n-1) x 4 float array. Raises ValueError if the edges
+    do not connect all nodes.
+
+    >>> Z = SingleLinkage(4, [(1,1,2),(3,1,3),(2,2,3),(9,3,4),(5,2,4)])
+    >>> Z
+    array([[0., 1., 1., 2.],
+           [2., 4., 2., 3.],
+           [3., 5., 5., 4.]])
+    """
+    Z = np.zeros(shape=(max(numNodes-1, 0), 4))
+    uf = UnionFind(numNodes)
+    clusterOf = range(numNodes)    # root item -> current cluster id
+    sizes = [1] * (2 * numNodes)
+    merges = 0
+    for dist, n1, n2 in sorted(edges):
+        if merges == numNodes - 1:
+            break
+        s1 = uf.find(n1-1)
+        s2 = uf.find(n2-1)
+        if s1 == s2:
+            continue
+        c1, c2 = sorted((clusterOf[s1], clusterOf[s2]))
+        newId = numNodes + merges
+        sizes[newId] = sizes[c1] + sizes[c2]
+        Z[merges] = (c1, c2, dist, sizes[newId])
+        uf.union(s1, s2)
+        clusterOf[uf.find(s1)] = newId
+        merges += 1
+    if merges < numNodes - 1:
+        raise ValueError('Edges do not connect all nodes')
+    return Z
+
+
+def _cutLinkage(Z, numMerges):
+    "Labels nodes 0..k-1 after applying the first numMerges rows of Z"
+    n = len(Z) + 1
+    parent = range(n + numMerges)
+    for i in xrange(numMerges):
+        parent[int(Z[i, 0])] = n + i
+        parent[int(Z[i, 1])] = n + i
+    # Parents have larger ids than children, so resolve top down
+    for c in xrange(n + numMerges - 1, -1, -1):
+        parent[c] = parent[parent[c]]
+    labels = []
+    relabel = {}
+    for v in xrange(n):
+        labels.append(relabel.setdefault(parent[v], len(relabel)))
+    return labels
+
+
+def CutClusters(Z, k):
+    """
+    Returns the cluster label (0..k-1) of each node in the k-clustering
+    encoded in single-linkage hierarchy Z. Runs in O(n).
+
+    >>> Z = SingleLinkage(4, [(1,1,2),(3,1,3),(2,2,3),(9,3,4),(5,2,4)])
+    >>> CutClusters(Z, 2), CutClusters(Z, 4)
+    ([0, 0, 0, 1], [0, 1, 2, 3])
+    """
+    n = len(Z) + 1
+    if not 1 <= k <= n:
+        raise ValueError('k must be between 1 and %d' % n)
+    return _cutLinkage(Z, n - k)
+
+
+def CutDistance(Z, t):
+    """
+    Returns cluster labels obtained by joining all nodes linked by
+    distances <= t in single-linkage hierarchy Z. Runs in O(n).
+
+    >>> Z = SingleLinkage(4, [(1,1,2),(3,1,3),(2,2,3),(9,3,4),(5,2,4)])
+    >>> CutDistance(Z, 1), CutDistance(Z, 4.5)
+    ([0, 0, 1, 2], [0, 0, 0, 1])
+    """
+    return _cutLinkage(Z, int(np.searchsorted(Z[:, 2], t, side='right')))
+
+
+def Spacing(Z, k):
+    """
+    Returns the spacing of the max-spacing k-clustering, i.e. the
+    distance of the next merge, or None for k == 1.
+
+    >>> Z = SingleLinkage(3, [(1,1,2),(3,1,3),(2,2,3)])
+    >>> [Spacing(Z, k) for k in (1, 2, 3)]
+    [None, 2.0, 1.0]
+    """
+    n = len(Z) + 1
+    if not 1 <= k <= n:
+        raise ValueError('k must be between 1 and %d' % n)
+    if k == 1:
+        return None
+    return Z[n - k, 2]
+
+def PointEdges(points):
+    """
+    Returns the Euclidean MST edges of an (n, d) array of points as a
+    sorted list of (d, n1, n2) tuples with 1-based node index.
+
+    The MST is all max-spacing clustering and SingleLinkage need, so
+    this replaces the O(n^2) distance list for coordinate inputs.
+
+    >>> PointEdges(np.array([[0, 0], [0, 1], [3, 0]]))
+    [(1.0, 1, 2), (3.0, 1, 3)]
+    """
+    return sorted((d, i+1, j+1) for d, i, j in EuclideanMST(points))
+
+
+def MaxSpacingPoints(points, k):
+    """
+    Max-spacing k-clustering of an (n, d) array of points under
+    Euclidean distance. Returns (spacing, clusters) like MaxSpacing.
+
+    >>> pts = np.array([[0, 0], [0, 1], [3, 0], [3, 2], [10, 0]])
+    >>> MaxSpacingPoints(pts, 3)
+    (3.0, {1: [0, 1], 3: [2, 3], 4: [4]})
+    >>> CutClusters(SingleLinkage(len(pts), PointEdges(pts)), 2)
+    [0, 0, 0, 0, 1]
+    """
+    return MaxSpacingSorted(len(points), iter(PointEdges(points)), k)
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
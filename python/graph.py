@@ -121,6 +121,40 @@ class Graph(object):
             if self.edges[eIdx][0] == idx:
                 yield eIdx
                 
+    def getCSR(self, reverse=False):
+        """Returns adjacency of a directed graph in compressed sparse
+        row form as (indptr, heads, edgeIdx).
+
+        Out-edges of vertex v are heads[indptr[v]:indptr[v+1]] and their
+        edge indices are edgeIdx[indptr[v]:indptr[v+1]]. If reverse is
+        True the in-edges are returned instead (heads then hold tails).
+        Building it is O(n + m) and avoids filtering getVert() lists
+        during traversals.
+
+        >>> G = Graph.loadFromFile('g0nn.txt', True)
+        >>> G.getCSR()
+        ([0, 2, 3, 5, 6, 6], [1, 2, 4, 1, 3, 4], [0, 2, 1, 3, 4, 5])
+        >>> G.getCSR(reverse=True)
+        ([0, 0, 2, 3, 4, 6], [0, 2, 0, 2, 1, 3], [0, 3, 2, 4, 1, 5])
+        """
+        src, dst = (1, 0) if reverse else (0, 1)
+        numVerts = self.numVerts
+        indptr = [0] * (numVerts + 1)
+        for edge in self.edges:
+            indptr[edge[src] + 1] += 1
+        for v in xrange(numVerts):
+            indptr[v + 1] += indptr[v]
+        fill = indptr[:-1]
+        heads = [0] * len(self.edges)
+        edgeIdx = [0] * len(self.edges)
+        for eIdx, edge in enumerate(self.edges):
+            v = edge[src]
+            pos = fill[v]
+            heads[pos] = edge[dst]
+            edgeIdx[pos] = eIdx
+            fill[v] = pos + 1
+        return indptr, heads, edgeIdx
+
     def clone(self):
         "Returns a deep copy of self"
         cloned = Graph(self.numVerts, self.numEdges)
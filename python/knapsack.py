@@ -3,10 +3,11 @@
 Functions to solve Knapsack problems.
 """
 
+import collections, hashlib, multiprocessing, random, sys, time
 import numpy as np
 
 def BottomUp(capacity, items):
-    """Build A[i,j] bottom up.
+    """Build A[i,j] bottom up, one row per item.
 
     capacity : capacity of the knapsack
     items : list of tuples (value, weight) for each item
@@ -15,21 +16,456 @@ def BottomUp(capacity, items):
     value of the items in the knapsack and max_items are the list
     of items selected to go into the knapsack.
 
+    Only the current row A[i,:] is kept. Each item updates it with one
+    vectorized np.maximum over the row and the row shifted by the
+    item's weight, and records which capacities took the item in a
+    packed bit matrix (about n x capacity / 8 bytes) that is walked
+    backwards to reconstruct max_items.
+
     >>> BottomUp(8, [(15,1),(10,5),(9,3),(5,4)])
-    29
+    (29, [0, 2, 3])
+    >>> BottomUp(0, [(3, 1)])
+    (0, [])
+    """
+    row, take = _solveRows(capacity, items)
+    return row[capacity].item(), _reconstruct(capacity, items, take)
+
+def _solveRows(capacity, items, keepTake=True):
+    """Runs the 0/1 knapsack DP over a single capacity row.
+
+    Returns (row, take) where row[c] is the best value within capacity
+    c and take is the packed (n, ceil((capacity+1)/8)) bit matrix of
+    take decisions, or None if keepTake is False.
     """
     n = len(items)
-    A = np.zeros(shape=(n+1, capacity+1), dtype=int)
-    for j in xrange(1, capacity+1):
-        for i in xrange(1, n+1):
-            vi, wi = items[i-1]
-            if j >= wi:
-                A[i,j] = max(A[i-1,j], A[i-1,j-wi] + vi)
-            else:
-                A[i,j] = A[i-1,j]
-    return A[n, capacity]
+    dtype = np.promote_types(np.array([v for v, _ in items] + [0]).dtype, np.int64)
+    row = np.zeros(capacity+1, dtype=dtype)
+    take = None
+    if keepTake:
+        take = np.zeros(shape=(n, (capacity+8) // 8), dtype=np.uint8)
+        taken = np.zeros(capacity+1, dtype=bool)
+    for i, (vi, wi) in enumerate(items):
+        if wi > capacity:
+            continue
+        cand = row[:capacity+1-wi] + vi
+        if keepTake:
+            taken[:wi] = False
+            np.greater(cand, row[wi:], out=taken[wi:])
+            take[i] = np.packbits(taken)
+        np.maximum(row[wi:], cand, out=row[wi:])
+    return row, take
+
+def _reconstruct(capacity, items, take):
+    "Walks the packed take bits backwards and returns chosen item index"
+    chosen = []
+    c = capacity
+    for i in xrange(len(items)-1, -1, -1):
+        if (take[i, c >> 3] >> (7 - (c & 7))) & 1:
+            chosen.append(i)
+            c -= items[i][1]
+    chosen.reverse()
+    return chosen
+
+def Hirschberg(capacity, items, parallel=False, leafCells=1<<22):
+    """Solve with linear memory by divide and conquer over the items.
+
+    capacity : capacity of the knapsack
+    items : list of tuples (value, weight) for each item
+    parallel : if True, the forward and backward rows of subproblems
+               larger than 16 * leafCells cells are computed in two
+               worker processes
+    leafCells : subproblems with at most this many (item, capacity)
+                cells are solved directly with BottomUp's bit matrix
+
+    Returns (max_val, max_items) like BottomUp.
+
+    The items are split in half. A value row for the first half F and
+    for the second half B give the best split of the capacity as the c
+    maximizing F[c] + B[capacity-c]; both halves are then solved
+    recursively with capacities c and capacity-c. Memory is O(capacity)
+    and the total work is about twice a value-only solve.
+
+    >>> Hirschberg(8, [(15,1),(10,5),(9,3),(5,4)], leafCells=0)
+    (29, [0, 2, 3])
+    >>> Hirschberg(8, [(15,1),(10,5),(9,3),(5,4)], parallel=True)
+    (29, [0, 2, 3])
+    """
+    pool = multiprocessing.Pool(2) if parallel else None
+    try:
+        chosen = _hirschberg(capacity, range(len(items)), items,
+                             pool, leafCells)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return sum(items[i][0] for i in chosen), chosen
+
+def _valueRow(args):
+    "Value-only DP row for (capacity, items); runs in worker processes"
+    capacity, items = args
+    return _solveRows(capacity, items, keepTake=False)[0]
+
+def _hirschberg(capacity, indices, items, pool, leafCells):
+    "Returns sorted index of the items chosen among indices"
+    sub = [items[i] for i in indices]
+    if len(indices) <= 1 or len(indices) * (capacity+1) <= leafCells:
+        row, take = _solveRows(capacity, sub)
+        return [indices[i] for i in _reconstruct(capacity, sub, take)]
+    mid = len(indices) // 2
+    args = [(capacity, sub[:mid]), (capacity, sub[mid:])]
+    if pool is not None and len(indices) * (capacity+1) > 16 * leafCells:
+        F, B = pool.map(_valueRow, args)
+    else:
+        F, B = [_valueRow(arg) for arg in args]
+    split = int(np.argmax(F + B[::-1]))
+    del F, B
+    return (_hirschberg(split, indices[:mid], items, pool, leafCells) +
+            _hirschberg(capacity - split, indices[mid:], items, pool, leafCells))
+
+def Sparse(capacity, items):
+    """Solve by keeping only Pareto-optimal (weight, value) pairs.
+
+    capacity : capacity of the knapsack
+    items : list of tuples (value, weight) for each item
+
+    Returns (max_val, max_items) like BottomUp.
+
+    After each item the list of reachable (weight, value) pairs is
+    merged with a copy shifted by the item's (weight, value); pairs
+    heavier than capacity or dominated by a lighter pair of at least
+    the same value are dropped. The work depends on the size of these
+    frontiers, not on the capacity, which suits instances with a huge
+    capacity and few items. For each stage only a back pointer and a
+    take flag per pair are kept for the reconstruction.
+
+    >>> Sparse(8, [(15,1),(10,5),(9,3),(5,4)])
+    (29, [0, 2, 3])
+    >>> Sparse(10**12, [(3, 4*10**11), (4, 5*10**11), (5, 6*10**11)])
+    (8, [0, 2])
+    """
+    W = np.zeros(1, dtype=np.int64)
+    V = np.zeros(1, dtype=np.int64)
+    stages = []    # (back pointer, take flag) arrays for each item
+    for vi, wi in items:
+        fits = W + wi <= capacity
+        n0 = len(W)
+        prev = np.concatenate((np.arange(n0), np.nonzero(fits)[0]))
+        Wall = np.concatenate((W, W[fits] + wi))
+        Vall = np.concatenate((V, V[fits] + vi))
+        taken = np.arange(len(Wall)) >= n0
+        # Lightest first, most valuable first among equal weights; keep a
+        # pair only if it beats every lighter pair.
+        order = np.lexsort((-Vall, Wall))
+        Vall = Vall[order]
+        best = np.maximum.accumulate(Vall)
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = Vall[1:] > best[:-1]
+        order = order[keep]
+        W = Wall[order]
+        V = Vall[keep]
+        stages.append((prev[order], taken[order]))
+    chosen = []
+    k = len(V) - 1      # values increase along the frontier
+    for i in xrange(len(items)-1, -1, -1):
+        prev, taken = stages[i]
+        if taken[k]:
+            chosen.append(i)
+        k = prev[k]
+    chosen.reverse()
+    return V[-1].item(), chosen
+
+def MeetInMiddle(capacity, items):
+    """Solve by enumerating all subsets of each half of the items.
+
+    capacity : capacity of the knapsack
+    items : list of tuples (value, weight), at most 40 of them
+
+    Returns (max_val, max_items) like BottomUp.
+
+    Weight and value sums of the 2^(n/2) subsets of each half are built
+    with NumPy by doubling; subset index bit j stands for item j of the
+    half. The second half is sorted by weight with a running best
+    value, and every subset of the first half binary searches it for
+    the best partner that fits in the remaining capacity.
+
+    >>> MeetInMiddle(8, [(15,1),(10,5),(9,3),(5,4)])
+    (29, [0, 2, 3])
+    """
+    n = len(items)
+    if n > 40:
+        raise ValueError('MeetInMiddle supports at most 40 items')
+    half = n // 2
+
+    def subsetSums(part):
+        W = np.zeros(1, dtype=np.int64)
+        V = np.zeros(1, dtype=np.int64)
+        for vi, wi in part:
+            W = np.concatenate((W, W + wi))
+            V = np.concatenate((V, V + vi))
+        return W, V
+
+    WA, VA = subsetSums(items[:half])
+    WB, VB = subsetSums(items[half:])
+    order = np.argsort(WB, kind='mergesort')
+    WB = WB[order]
+    VB = VB[order]
+    bestB = np.maximum.accumulate(VB)
+    # Position of the running best: latest position attaining it
+    pos = np.arange(len(VB))
+    bestPos = np.maximum.accumulate(np.where(VB == bestB, pos, 0))
+    fits = np.nonzero(WA <= capacity)[0]
+    partner = np.searchsorted(WB, capacity - WA[fits], side='right') - 1
+    total = VA[fits] + bestB[partner]
+    k = int(np.argmax(total))
+    maskA = int(fits[k])
+    maskB = int(order[bestPos[partner[k]]])
+    chosen = ([i for i in xrange(half) if maskA >> i & 1] +
+              [half + i for i in xrange(n - half) if maskB >> i & 1])
+    return total[k].item(), chosen
+
+def BoundedSplit(capacity, items):
+    """Solve the bounded knapsack problem by binary splitting.
+
+    capacity : capacity of the knapsack
+    items : list of tuples (value, weight, count) for each item
+
+    Returns (max_val, counts) where counts[i] is how many copies of
+    item i are taken.
+
+    An item with count k becomes bundles of 1, 2, 4, ... copies plus a
+    remainder, any number 0..k of copies being a sum of distinct
+    bundles, so only O(log k) 0/1 items are passed to BottomUp instead
+    of k copies.
+
+    >>> BoundedSplit(10, [(5, 3, 2), (4, 2, 3), (1, 1, 10)])
+    (18, [2, 2, 0])
+    """
+    bundles = []
+    owner = []
+    for i, (vi, wi, ki) in enumerate(items):
+        size = 1
+        while ki > 0:
+            take = min(size, ki)
+            bundles.append((vi * take, wi * take))
+            owner.append((i, take))
+            ki -= take
+            size *= 2
+    max_val, chosen = BottomUp(capacity, bundles)
+    counts = [0] * len(items)
+    for b in chosen:
+        i, take = owner[b]
+        counts[i] += take
+    return max_val, counts
+
+def _windowMax(H, window):
+    """Max of H[t] over t in [j-window+1, j] for every row j of H,
+    computed per column with van Herk/Gil-Werman block prefix and
+    suffix maxima."""
+    m = len(H)
+    if window >= m:
+        return np.maximum.accumulate(H, axis=0)
+    blocks = -(-m // window)
+    pad = blocks * window - m
+    Hp = np.concatenate((H, np.full((pad,) + H.shape[1:], H.min(), H.dtype)))
+    Hb = Hp.reshape((blocks, window) + H.shape[1:])
+    P = np.maximum.accumulate(Hb, axis=1).reshape(Hp.shape)[:m]
+    S = np.maximum.accumulate(Hb[:, ::-1], axis=1)[:, ::-1].reshape(Hp.shape)
+    F = P.copy()
+    np.maximum(P[window-1:], S[:m-window+1], out=F[window-1:])
+    return F
+
+def _residueUpdate(row, vi, wi, count):
+    """Applies an item with count copies (None for unlimited) to a DP
+    row in place. Capacities are grouped by residue modulo wi; along
+    each residue class this is a sliding window max, done for all
+    classes at once on a (capacity/wi, wi) view.
 
-def TopDown(capacity, items, memoized={}):
+    For count=None the window is a prefix and the argmax is tracked
+    too: the array of copies of the item each new entry uses is
+    returned (None otherwise). Entries that use no copy keep their old
+    value exactly."""
+    C1 = len(row)
+    if wi == 0:
+        if vi > 0 and count is not None:
+            row += vi * count
+        elif vi > 0:
+            raise ValueError('Unbounded item with zero weight')
+        return
+    m = -(-C1 // wi)
+    if row.dtype.kind == 'f':
+        low = -np.inf
+    else:
+        low = np.iinfo(row.dtype).min // 2
+    G = np.full(m * wi, low, dtype=row.dtype)
+    G[:C1] = row
+    G = G.reshape(m, wi)
+    shift = (np.arange(m) * vi)[:, None]
+    if count is None:
+        # T[j] is the last t <= j where H reaches its prefix max, so
+        # T[j] == j unless copies of the item beat row[j]
+        H = G - shift
+        P = np.maximum.accumulate(H, axis=0)
+        rows = np.arange(m)[:, None]
+        T = np.maximum.accumulate(np.where(H >= P, rows, 0), axis=0)
+        copies = rows - T
+        F = np.take_along_axis(G, T, axis=0) + copies * vi
+        row[:] = F.reshape(-1)[:C1]
+        return copies.reshape(-1)[:C1]
+    F = _windowMax(G - shift, count + 1) + shift
+    row[:] = F.reshape(-1)[:C1]
+
+def BoundedWindow(capacity, items):
+    """Solve the bounded knapsack problem exactly in O(n * capacity).
+
+    capacity : capacity of the knapsack
+    items : list of tuples (value, weight, count) for each item
+
+    Returns max_val, the maximum value of the knapsack.
+
+    For an item (v, w, k) the new row at capacity r + j*w is
+    max(row[r + t*w] - t*v for j-k <= t <= j) + j*v, a sliding window
+    maximum along each residue r modulo w. That is what a monotone
+    deque per residue computes; here all residues are handled at once
+    with NumPy block prefix/suffix maxima, which gives the same maxima
+    without a Python loop over capacities. Use BoundedSplit when the
+    chosen counts are needed.
+
+    >>> BoundedWindow(10, [(5, 3, 2), (4, 2, 3), (1, 1, 10)])
+    18
+    """
+    row = np.zeros(capacity+1, dtype=np.promote_types(
+        np.array([v for v, _, _ in items] + [0]).dtype, np.int64))
+    for vi, wi, ki in items:
+        _residueUpdate(row, vi, wi, ki)
+    return row[capacity].item()
+
+def Unbounded(capacity, items):
+    """Solve the unbounded knapsack problem (any number of copies).
+
+    capacity : capacity of the knapsack
+    items : list of tuples (value, weight) for each item
+
+    Returns (max_val, counts) where counts[i] is how many copies of
+    item i are taken.
+
+    Each item is a prefix maximum along the residue classes of its
+    weight (a window without a left end). take[c] records the last
+    item whose prefix argmax used a copy of it at c; that copy ends an
+    optimal packing for c, so the counts follow take from c to
+    c - weight until no item was taken, which always ends. Takes come
+    from the argmax rather than from comparing values, so float
+    rounding cannot credit or miss an item.
+
+    >>> Unbounded(10, [(5, 3), (4, 2), (1, 1)])
+    (20, [0, 5, 0])
+    >>> Unbounded(7, [(0.1, 3), (0.2, 2), (0.3, 1)])
+    (2.1, [0, 0, 7])
+    >>> Unbounded(5, [(1e-10, 1)])
+    (5e-10, [5])
+    >>> Unbounded(2, [(1e12, 1), (2e12+500, 2)])
+    (2000000000500.0, [0, 1])
+    """
+    row = np.zeros(capacity+1, dtype=np.promote_types(
+        np.array([v for v, _ in items] + [0]).dtype, np.int64))
+    take = np.full(capacity+1, -1, dtype=np.int64)
+    for i, (vi, wi) in enumerate(items):
+        copies = _residueUpdate(row, vi, wi, None)
+        if copies is not None:
+            take[copies > 0] = i
+    counts = [0] * len(items)
+    c = capacity
+    while take[c] >= 0:
+        i = take[c]
+        counts[i] += 1
+        c -= items[i][1]
+    return row[capacity].item(), counts
+
+def Approximate(capacity, items, eps=0.1):
+    """Solve within a factor (1 - eps) of the optimum (FPTAS).
+
+    capacity : capacity of the knapsack
+    items : list of tuples (value, weight) for each item
+    eps : allowed relative error, 0 < eps < 1
+
+    Returns (max_val, max_items, upper) where max_val and max_items
+    are as in BottomUp and upper is a proven upper bound on the
+    optimum, so that max_val >= (1 - eps) * upper >= (1 - eps) * opt.
+
+    Values are scaled down by K = eps * vmax / n and rounded, then a
+    DP over scaled value keeps the minimum weight reaching each value,
+    one vectorized row update per item, with packed take bits for the
+    reconstruction. Rounding loses less than K per item, so the
+    optimum is at most max_val + n*K = max_val + eps*vmax. The row
+    has at most n^2/eps entries regardless of capacity or values.
+
+    >>> Approximate(8, [(15,1),(10,5),(9,3),(5,4)], eps=0.1)
+    (29, [0, 2, 3], 30.5)
+    >>> Approximate(1, [(15,2)])
+    (0, [], 0)
+    """
+    if not 0 < eps < 1:
+        raise ValueError('eps must be between 0 and 1')
+    feasible = [i for i, (vi, wi) in enumerate(items)
+                if wi <= capacity and vi > 0]
+    if not feasible:
+        return 0, [], 0
+    n = len(feasible)
+    vmax = max(items[i][0] for i in feasible)
+    K = eps * vmax / float(n)
+    profits = [int(items[i][0] // K) for i in feasible]
+    P = sum(profits)
+    # minW[p] = least weight reaching scaled value p, capped at
+    # capacity+1 which stands for unreachable.
+    minW = np.full(P+1, capacity+1, dtype=np.int64)
+    minW[0] = 0
+    take = np.zeros(shape=(n, (P+8) // 8), dtype=np.uint8)
+    taken = np.zeros(P+1, dtype=bool)
+    for k, i in enumerate(feasible):
+        pi, wi = profits[k], items[i][1]
+        cand = np.minimum(minW[:P+1-pi] + wi, capacity+1)
+        taken[:pi] = False
+        np.less(cand, minW[pi:], out=taken[pi:])
+        take[k] = np.packbits(taken)
+        np.minimum(minW[pi:], cand, out=minW[pi:])
+    p = int(np.nonzero(minW <= capacity)[0][-1])
+    chosen = []
+    for k in xrange(n-1, -1, -1):
+        if (take[k, p >> 3] >> (7 - (p & 7))) & 1:
+            chosen.append(feasible[k])
+            p -= profits[k]
+    chosen.reverse()
+    max_val = sum(items[i][0] for i in chosen)
+    return max_val, chosen, max_val + n * K
+
+def Benchmark(sizes=(50, 100, 200), eps=0.1, seed=0):
+    """Compares Approximate with BottomUp on random instances.
+
+    For each n in sizes, n items with values up to 10^6 and weights up
+    to 10^4 are drawn and the capacity is half the total weight.
+    Returns a list of tuples (n, capacity, exactTime, approxTime,
+    exactVal, approxVal) with times in seconds.
+
+    >>> rows = Benchmark(sizes=(20,), eps=0.2)
+    >>> n, C, tExact, tApprox, exact, approx = rows[0]
+    >>> approx >= (1 - 0.2) * exact
+    True
+    """
+    rng = random.Random(seed)
+    rows = []
+    for n in sizes:
+        items = [(rng.randint(1, 10**6), rng.randint(1, 10**4))
+                 for _ in xrange(n)]
+        capacity = sum(wi for _, wi in items) // 2
+        started = time.time()
+        exact = BottomUp(capacity, items)[0]
+        tExact = time.time() - started
+        started = time.time()
+        approx = Approximate(capacity, items, eps)[0]
+        tApprox = time.time() - started
+        rows.append((n, capacity, tExact, tApprox, exact, approx))
+    return rows
+
+def TopDown(capacity, items):
     """Evaluate A[i,j] recursively.
 
     capacity : capacity of the knapsack
@@ -62,7 +498,121 @@ def TopDown(capacity, items, memoized={}):
     memoized = {}
     return SubProb(n, capacity)
 
+class KnapsackSolver(object):
+    """Answers knapsack queries for one list of items at many capacities.
+
+    One BottomUp style DP row is computed up to the largest capacity
+    asked for so far. Its entry row[c] is the best value within
+    capacity c for every c at once, so best(c) is a lookup, and the
+    packed take bits reconstruct the items for any such c. A larger
+    capacity recomputes the row for at least twice the previous
+    capacity, which keeps the total work within a constant factor of
+    one solve at the largest capacity.
+
+    items : list of tuples (value, weight) for each item
+    reconstruct : keep the take bits so select() works (n x C/8 bytes)
+
+    >>> S = KnapsackSolver([(15,1),(10,5),(9,3),(5,4)])
+    >>> S.best(8), S.best(4), S.best(0)
+    (29, 24, 0)
+    >>> S.select(8)
+    [0, 2, 3]
+    >>> S.bestMany([1, 5, 6])
+    [15, 24, 25]
+    >>> S.capacity
+    8
+    >>> S.best(13)
+    39
+    >>> S.capacity
+    16
+    >>> S.best(-1)
+    Traceback (most recent call last):
+        ...
+    ValueError: Negative capacity: -1
+    >>> S.bestMany([3, -2])
+    Traceback (most recent call last):
+        ...
+    ValueError: Negative capacity: -2
+    """
+    def __init__(self, items, reconstruct=True):
+        self.items = list(items)
+        self.reconstruct = reconstruct
+        self.capacity = -1
+        self.row = None
+        self.take = None
+
+    def grow(self, capacity):
+        "Makes sure queries up to capacity can be answered"
+        if capacity < 0:
+            raise ValueError('Negative capacity: %d' % capacity)
+        if capacity > self.capacity:
+            capacity = max(capacity, 2 * self.capacity)
+            self.row, self.take = _solveRows(capacity, self.items,
+                                             self.reconstruct)
+            self.capacity = capacity
+
+    def best(self, capacity):
+        "Returns the maximum value within capacity"
+        self.grow(capacity)
+        return self.row[capacity].item()
+
+    def bestMany(self, capacities):
+        "Returns best(c) for each c in capacities as a list"
+        capacities = np.asarray(capacities, dtype=np.int64)
+        if not len(capacities):
+            return []
+        if capacities.min() < 0:
+            raise ValueError('Negative capacity: %d' % capacities.min())
+        self.grow(int(capacities.max()))
+        return self.row[capacities].tolist()
+
+    def select(self, capacity):
+        "Returns the list of item index chosen at capacity"
+        if not self.reconstruct:
+            raise ValueError('Solver built with reconstruct=False')
+        self.grow(capacity)
+        return _reconstruct(capacity, self.items, self.take)
+
+    def __repr__(self):
+        return "<KnapsackSolver n=%d capacity=%d>" % (
+            len(self.items), self.capacity)
+
+_solverCache = collections.OrderedDict()
+
+def itemsFingerprint(items):
+    "Returns a hashable digest identifying a list of (value, weight) items"
+    return hashlib.sha1(repr([tuple(item) for item in items])).hexdigest()
+
+def CachedSolver(items, maxSize=32):
+    """Returns the KnapsackSolver for items, reusing one built earlier
+    for the same items. At most maxSize solvers are kept; the least
+    recently used one is dropped first.
+
+    >>> S = CachedSolver([(15,1),(10,5),(9,3),(5,4)])
+    >>> S.best(8)
+    29
+    >>> CachedSolver([(15,1),(10,5),(9,3),(5,4)]) is S
+    True
+    >>> CachedSolver([(15,1)]) is S
+    False
+    """
+    key = itemsFingerprint(items)
+    solver = _solverCache.pop(key, None)
+    if solver is None:
+        solver = KnapsackSolver(items)
+    _solverCache[key] = solver
+    while len(_solverCache) > maxSize:
+        _solverCache.popitem(last=False)
+    return solver
+
 if __name__ == '__main__':
-    import doctest
-    doctest.testmod()
+    if sys.argv[1:] == ['bench']:
+        print "%6s %10s %9s %9s %8s" % ('n', 'capacity', 'exact(s)',
+                                        'approx(s)', 'ratio')
+        for n, C, tExact, tApprox, exact, approx in Benchmark():
+            print "%6d %10d %9.3f %9.3f %8.5f" % (n, C, tExact, tApprox,
+                                                  approx / float(exact))
+    else:
+        import doctest
+        doctest.testmod()
     
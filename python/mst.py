@@ -10,8 +10,10 @@ Input : undirected graph G = (V, E) where Ce is cost
 
 from __future__ import division
 import heapq
+import numpy as np
 from graph import Graph
 from util import UnionFind
+from spatial import KDTree
 
 def Prim(G):
     """
@@ -113,6 +115,113 @@ def Kruskal(G):
     return MST
 
 
+def EuclideanMST(points, leafSize=16):
+    """
+    Implements Boruvka's minimum spanning tree algorithm for the
+    complete Euclidean graph of a point set, without building its
+    O(n^2) edges.
+
+    points : (n, d) array of coordinates
+
+    Each round finds, for every component, the nearest point in another
+    component with KD-tree queries and adds those edges, which at least
+    halves the number of components. A KD-tree node whose points all
+    belong to the querying component is skipped, as is any node farther
+    away than the best edge already found for that component. Points
+    are queried one leaf at a time so the tree walk is shared by the
+    points of a leaf.
+
+    Returns a list of (d, i, j) tuples, one per MST edge, where i and j
+    are 0-based point index and d is their Euclidean distance.
+
+    >>> pts = np.array([[0, 0], [0, 1], [3, 0], [3, 2], [10, 0]])
+    >>> sorted(EuclideanMST(pts))
+    [(1.0, 0, 1), (2.0, 2, 3), (3.0, 0, 2), (7.0, 2, 4)]
+    """
+    T = KDTree(points, leafSize)
+    data = T.data
+    n = len(data)
+    # Boxes as plain lists; per node numpy calls on d-vectors would
+    # dominate the running time.
+    LO = [lo.tolist() for lo in T.lo]
+    HI = [hi.tolist() for hi in T.hi]
+    def boxDist2(a, b):
+        "Squared distance between the bounding boxes of node a and b"
+        dist = 0.0
+        for loA, hiA, loB, hiB in zip(LO[a], HI[a], LO[b], HI[b]):
+            if loA > hiB:
+                dist += (loA - hiB) ** 2
+            elif loB > hiA:
+                dist += (loB - hiA) ** 2
+        return dist
+    leaves = [node for node in xrange(T.numNodes) if T.left[node] < 0]
+    uf = UnionFind(n)
+    MST = []
+    while uf.numSets > 1:
+        comp = np.array([uf.find(i) for i in xrange(n)])
+        # nodeComp[k] is the component of all points in node k, or -1
+        nodeComp = [-1] * T.numNodes
+        for node in xrange(T.numNodes - 1, -1, -1):
+            l = T.left[node]
+            if l < 0:
+                c = comp[T.idx[T.start[node]:T.end[node]]]
+                if (c == c[0]).all():
+                    nodeComp[node] = c[0]
+            elif nodeComp[l] >= 0 and nodeComp[l] == nodeComp[T.right[node]]:
+                nodeComp[node] = nodeComp[l]
+        # Nearest outside point for each component: (dist2, i, j)
+        best = {}
+        # Query the points of one leaf at a time, pruning with the
+        # leaf's bounding box and the worst bound among its points.
+        for leaf in leaves:
+            qIds = T.idx[T.start[leaf]:T.end[leaf]]
+            X = data[qIds]
+            qComp = comp[qIds]
+            homogeneous = nodeComp[leaf]
+            bound = np.array([best[c][0] if c in best else np.inf
+                              for c in qComp.tolist()])
+            worst = bound.max()
+            nearest = np.full(len(qIds), -1)
+            stack = [(0, 0.0)]
+            while stack:
+                node, dist = stack.pop()
+                if dist >= worst or (homogeneous >= 0 and
+                                     nodeComp[node] == homogeneous):
+                    continue
+                l = T.left[node]
+                if l < 0:
+                    ids = T.idx[T.start[node]:T.end[node]]
+                    diff = X[:, None, :] - data[ids][None, :, :]
+                    d2 = np.einsum('ijk,ijk->ij', diff, diff)
+                    d2[qComp[:, None] == comp[ids][None, :]] = np.inf
+                    k = d2.argmin(axis=1)
+                    d2 = d2[np.arange(len(qIds)), k]
+                    better = d2 < bound
+                    if better.any():
+                        bound[better] = d2[better]
+                        nearest[better] = ids[k[better]]
+                        worst = bound.max()
+                else:
+                    # Visit the nearer child first
+                    r = T.right[node]
+                    dl = boxDist2(l, leaf)
+                    dr = boxDist2(r, leaf)
+                    if dl <= dr:
+                        stack.append((r, dr)); stack.append((l, dl))
+                    else:
+                        stack.append((l, dl)); stack.append((r, dr))
+            for i, c, d2, j in zip(qIds.tolist(), qComp.tolist(),
+                                   bound.tolist(), nearest.tolist()):
+                if j >= 0 and (c not in best or d2 < best[c][0]):
+                    best[c] = (d2, i, j)
+        for d2, i, j in best.values():
+            s1, s2 = uf.find(i), uf.find(j)
+            if s1 != s2:
+                uf.union(s1, s2)
+                MST.append((float(np.sqrt(d2)), min(i, j), max(i, j)))
+    return MST
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
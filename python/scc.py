@@ -5,6 +5,9 @@ Implements strongly connected components algorithms.
 Input is a directed graph. 
 """
 
+import heapq, time
+import multiprocessing
+import numpy as np
 from graph import Graph
 
 def Kosaraju(G):
@@ -71,6 +74,395 @@ def Kosaraju(G):
             result.append(scc)
     return result
     
+def Pearce(G):
+    """
+    Single pass strongly connected components using Pearce's
+    space efficient variant of Tarjan's algorithm.
+
+    The depth first search is iterative, so there is no recursion
+    limit, and besides the search stacks the only per vertex state is
+    one array of ints (rindex) plus one root flag per vertex. rindex
+    is turned into the component label array in place.
+
+    Returns (labels, (indptr, succ)) where labels[v] is the component
+    index of vertex v and (indptr, succ) is the condensation DAG in
+    compressed sparse row form: successors of component c are
+    succ[indptr[c]:indptr[c+1]], without duplicates. Components are
+    numbered in reverse topological order (sink components first), so
+    every condensation edge c -> d has d < c.
+
+    >>> G = Graph.loadFromFile('scc0.txt', one_based=True)
+    >>> labels, (indptr, succ) = Pearce(G)
+    >>> labels
+    [2, 0, 1, 2, 0, 1, 2, 0, 1]
+    >>> indptr, succ
+    ([0, 0, 1, 2], [0, 1])
+    """
+    n = G.numVerts
+    indptr, heads, _ = G.getCSR()
+    rindex = [0] * n
+    isRoot = bytearray(n)
+    index = 1           # next dfs index; indices stay below c
+    c = n - 1           # next component id, counting down
+    S = []              # vertices visited but not yet assigned
+    for s in xrange(n):
+        if rindex[s]:
+            continue
+        rindex[s] = index; index += 1; isRoot[s] = 1
+        callV = [s]
+        callE = [indptr[s]]
+        while callV:
+            v = callV[-1]
+            e = callE[-1]
+            end = indptr[v+1]
+            while e < end:
+                w = heads[e]
+                if rindex[w] == 0:
+                    # Descend; edge e is looked at again on return
+                    break
+                if rindex[w] < rindex[v]:
+                    rindex[v] = rindex[w]
+                    isRoot[v] = 0
+                e += 1
+            if e < end:
+                callE[-1] = e
+                rindex[w] = index; index += 1; isRoot[w] = 1
+                callV.append(w)
+                callE.append(indptr[w])
+                continue
+            # All edges of v done
+            callV.pop(); callE.pop()
+            if isRoot[v]:
+                index -= 1
+                while S and rindex[v] <= rindex[S[-1]]:
+                    w = S.pop()
+                    rindex[w] = c
+                    index -= 1
+                rindex[v] = c
+                c -= 1
+            else:
+                S.append(v)
+
+    # Relabel so components are numbered 0, 1, ... in completion order
+    labels = rindex
+    for v in xrange(n):
+        labels[v] = n - 1 - labels[v]
+    numComps = n - 1 - c
+
+    # Group vertices by component (counting sort) and collect distinct
+    # successor components, using seen[] to drop duplicates.
+    start = [0] * (numComps + 1)
+    for v in xrange(n):
+        start[labels[v] + 1] += 1
+    for k in xrange(numComps):
+        start[k + 1] += start[k]
+    members = [0] * n
+    fill = start[:-1]
+    for v in xrange(n):
+        members[fill[labels[v]]] = v
+        fill[labels[v]] += 1
+    seen = [-1] * numComps
+    cindptr = [0] * (numComps + 1)
+    succ = []
+    for k in xrange(numComps):
+        seen[k] = k
+        for i in xrange(start[k], start[k+1]):
+            v = members[i]
+            for e in xrange(indptr[v], indptr[v+1]):
+                d = labels[heads[e]]
+                if seen[d] != k:
+                    seen[d] = k
+                    succ.append(d)
+        cindptr[k + 1] = len(succ)
+    return labels, (cindptr, succ)
+
+def _trim(alive, outPtr, outAdj, inPtr, inAdj):
+    """Repeatedly removes alive vertices with no alive in-edges or no
+    alive out-edges. Each of them is a trivial SCC. Returns the list
+    of removed vertices."""
+    n = len(alive)
+    indeg = [0] * n
+    outdeg = [0] * n
+    for v in xrange(n):
+        if alive[v]:
+            for i in xrange(outPtr[v], outPtr[v+1]):
+                w = outAdj[i]
+                if alive[w]:
+                    outdeg[v] += 1
+                    indeg[w] += 1
+    queue = [v for v in xrange(n)
+             if alive[v] and (indeg[v] == 0 or outdeg[v] == 0)]
+    removed = []
+    while queue:
+        v = queue.pop()
+        if not alive[v]:
+            continue
+        alive[v] = 0
+        removed.append(v)
+        for i in xrange(outPtr[v], outPtr[v+1]):
+            w = outAdj[i]
+            if alive[w]:
+                indeg[w] -= 1
+                if indeg[w] == 0:
+                    queue.append(w)
+        for i in xrange(inPtr[v], inPtr[v+1]):
+            u = inAdj[i]
+            if alive[u]:
+                outdeg[u] -= 1
+                if outdeg[u] == 0:
+                    queue.append(u)
+    return removed
+
+
+def _reach(start, ptr, adj, alive, allowed=None):
+    """Returns vertices reachable from start through alive vertices.
+    If allowed is given, only vertices v with allowed(v) are entered."""
+    seen = set([start])
+    stack = [start]
+    while stack:
+        v = stack.pop()
+        for i in xrange(ptr[v], ptr[v+1]):
+            w = adj[i]
+            if alive[w] and w not in seen and (allowed is None or allowed(w)):
+                seen.add(w)
+                stack.append(w)
+    return seen
+
+
+def _coloringSCC(G):
+    """Coloring SCC decomposition of G. Runs in a worker process.
+
+    Each round trims trivial SCCs, propagates the largest vertex id
+    forward until no color changes, and then collects, for each vertex
+    r that kept its own color, the vertices of color r that reach r
+    backwards. Those form the SCC of r.
+    """
+    n = G.numVerts
+    outPtr, outAdj, _ = G.getCSR()
+    inPtr, inAdj, _ = G.getCSR(reverse=True)
+    alive = bytearray([1]) * n
+    sccs = [[v] for v in _trim(alive, outPtr, outAdj, inPtr, inAdj)]
+    while any(alive):
+        color = range(n)
+        work = [v for v in xrange(n) if alive[v]]
+        while work:
+            v = work.pop()
+            cv = color[v]
+            for i in xrange(outPtr[v], outPtr[v+1]):
+                w = outAdj[i]
+                if alive[w] and color[w] < cv:
+                    color[w] = cv
+                    work.append(w)
+        for r in xrange(n):
+            if alive[r] and color[r] == r:
+                scc = _reach(r, inPtr, inAdj, alive,
+                             lambda w: color[w] == r)
+                for v in scc:
+                    alive[v] = 0
+                sccs.append(list(scc))
+        sccs.extend([v] for v in _trim(alive, outPtr, outAdj, inPtr, inAdj))
+    return sccs
+
+
+def ParallelSCC(G, processes=None):
+    """
+    Strongly connected components using trimming, forward-backward
+    search and coloring, with the coloring step run in a process pool.
+
+    1. Trim: vertices with in- or out-degree 0 are trivial SCCs and
+       are removed repeatedly.
+    2. Forward-backward: the vertices both reachable from and reaching
+       a high degree pivot form its SCC, typically the giant one.
+    3. Coloring: what is left splits into weakly connected pieces that
+       no SCC crosses. The pieces are packed into batches and each
+       batch is decomposed by _coloringSCC in a worker process.
+
+    processes : number of worker processes; None uses all cores and 1
+                runs everything in the calling process.
+
+    Returns a list of vertex lists, one per SCC, partitioning the
+    vertices the same way Kosaraju does (order may differ).
+
+    >>> G = Graph.loadFromFile('scc0.txt', one_based=True)
+    >>> sorted(sorted(scc) for scc in ParallelSCC(G, processes=2))
+    [[0, 3, 6], [1, 4, 7], [2, 5, 8]]
+    """
+    n = G.numVerts
+    outPtr, outAdj, _ = G.getCSR()
+    inPtr, inAdj, _ = G.getCSR(reverse=True)
+    alive = bytearray([1]) * n
+    result = [[v] for v in _trim(alive, outPtr, outAdj, inPtr, inAdj)]
+
+    # Forward-backward search from the vertex with most in x out edges
+    pivot, best = -1, -1
+    for v in xrange(n):
+        if alive[v]:
+            deg = (inPtr[v+1] - inPtr[v]) * (outPtr[v+1] - outPtr[v])
+            if deg > best:
+                pivot, best = v, deg
+    if pivot < 0:
+        return result
+    fw = _reach(pivot, outPtr, outAdj, alive)
+    bw = _reach(pivot, inPtr, inAdj, alive)
+    giant = fw & bw
+    for v in giant:
+        alive[v] = 0
+    result.append(list(giant))
+
+    # The rest splits into F - S, B - S and the remainder; no SCC spans
+    # two of them, so cut edges between them and find weak components.
+    part = bytearray(n)
+    for v in fw:
+        part[v] = 1
+    for v in bw:
+        part[v] = 2
+    pieceOf = [-1] * n
+    pieces = []
+    for s in xrange(n):
+        if alive[s] and pieceOf[s] < 0:
+            ps = part[s]
+            pieceOf[s] = len(pieces)
+            piece = [s]
+            stack = [s]
+            while stack:
+                v = stack.pop()
+                for ptr, adj in ((outPtr, outAdj), (inPtr, inAdj)):
+                    for i in xrange(ptr[v], ptr[v+1]):
+                        w = adj[i]
+                        if alive[w] and part[w] == ps and pieceOf[w] < 0:
+                            pieceOf[w] = pieceOf[s]
+                            piece.append(w)
+                            stack.append(w)
+            pieces.append(piece)
+    if not pieces:
+        return result
+
+    # Pack pieces into batches of similar size (largest first, each to
+    # the lightest batch) and build one renumbered subgraph per batch.
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    numBatches = min(len(pieces), max(1, processes * 4))
+    batches = [(0, b, []) for b in xrange(numBatches)]
+    for piece in sorted(pieces, key=len, reverse=True):
+        size, b, verts = heapq.heappop(batches)
+        verts.extend(piece)
+        heapq.heappush(batches, (size + len(piece), b, verts))
+    tasks = []
+    local = [0] * n
+    for _, _, verts in batches:
+        for i, v in enumerate(verts):
+            local[v] = i
+        edges = [(local[v], local[outAdj[i]])
+                 for v in verts
+                 for i in xrange(outPtr[v], outPtr[v+1])
+                 if pieceOf[outAdj[i]] == pieceOf[v]]
+        sub = Graph(len(verts), len(edges))
+        for v1, v2 in edges:
+            sub.addEdge(v1, v2)
+        tasks.append((verts, sub))
+
+    if processes > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            subResults = pool.map(_coloringSCC, [sub for _, sub in tasks])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        subResults = [_coloringSCC(sub) for _, sub in tasks]
+    for (verts, _), sccs in zip(tasks, subResults):
+        result.extend([verts[v] for v in scc] for scc in sccs)
+    return result
+
+class ReachIndex(object):
+    """Answers "can u reach v?" queries on a directed graph.
+
+    The graph is condensed with Pearce and the transitive closure of
+    the condensation DAG is computed once as packed bit rows. Since
+    Pearce numbers components in reverse topological order, component
+    c only reaches components <= c: its row holds bits 0..c, i.e.
+    c // 8 + 1 bytes, and the rows are stored back to back in one
+    uint8 array (closure) starting at offsets[c]. Each row only needs
+    the rows of lower numbered components, so one pass over the
+    components in order suffices, and a query is a single byte lookup.
+
+    With intervals=True each component c also keeps low[c], the
+    smallest component it reaches. v's component must lie within
+    [low[c], c] for u to reach v, which rejects most negative queries
+    without touching the bitsets.
+
+    buildTime (seconds) and numBytes (approximate index memory) report
+    the cost of the index.
+
+    >>> G = Graph.loadFromFile('scc0.txt', one_based=True)
+    >>> R = ReachIndex(G)
+    >>> R.reaches(0, 8), R.reaches(8, 0), R.reaches(4, 4), R.reaches(7, 1)
+    (True, False, True, True)
+    >>> R.reachesMany([(2, 1), (1, 2), (6, 5)])
+    [True, False, True]
+    >>> R.reachesMany([])
+    []
+    >>> R.numComps
+    3
+    """
+    def __init__(self, G, intervals=True):
+        started = time.time()
+        labels, (indptr, succ) = Pearce(G)
+        numComps = len(indptr) - 1
+        sizes = np.arange(numComps, dtype=np.int64) // 8 + 1
+        offsets = np.zeros(numComps + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        closure = np.zeros(int(offsets[-1]), dtype=np.uint8)
+        low = range(numComps)
+        for c in xrange(numComps):
+            o = offsets[c]
+            row = closure[o:o + sizes[c]]
+            row[c >> 3] = 1 << (c & 7)
+            lo = c
+            for i in xrange(indptr[c], indptr[c+1]):
+                d = succ[i]
+                od = offsets[d]
+                row[:sizes[d]] |= closure[od:od + sizes[d]]
+                if low[d] < lo:
+                    lo = low[d]
+            low[c] = lo
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.closure = closure
+        self.offsets = offsets[:-1]
+        self.low = np.asarray(low, dtype=np.int64) if intervals else None
+        self.numComps = numComps
+        self.buildTime = time.time() - started
+        self.numBytes = (self.labels.nbytes + closure.nbytes +
+                         self.offsets.nbytes)
+        if intervals:
+            self.numBytes += self.low.nbytes
+
+    def reaches(self, u, v):
+        "Returns True if there is a path from vertex u to vertex v"
+        cu = self.labels.item(u)
+        cv = self.labels.item(v)
+        if cu == cv:
+            return True
+        if cv > cu or (self.low is not None and cv < self.low.item(cu)):
+            return False
+        byte = self.closure.item(self.offsets.item(cu) + (cv >> 3))
+        return bool((byte >> (cv & 7)) & 1)
+
+    def reachesMany(self, pairs):
+        "Returns reaches(u, v) for each (u, v) in pairs as a list"
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        cu = self.labels[pairs[:, 0]]
+        cv = self.labels[pairs[:, 1]]
+        # Components above cu are never reached; look up byte 0 instead
+        below = cv <= cu
+        idx = self.offsets[cu] + np.where(below, cv >> 3, 0)
+        bits = (self.closure[idx] >> (cv & 7).astype(np.uint8)) & 1
+        return (below & (bits == 1)).tolist()
+
+    def __repr__(self):
+        return "<ReachIndex comps=%d bytes=%d buildTime=%.3fs>" % (
+            self.numComps, self.numBytes, self.buildTime)
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
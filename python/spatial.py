@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Spatial index for point sets.
+
+Contains a KD-tree used by geometric algorithms (Euclidean MST,
+nearest neighbour candidate lists).
+"""
+from __future__ import division
+import heapq
+import numpy as np
+
+class KDTree(object):
+    """KD-tree over an (n, d) array of points.
+
+    Nodes are kept in flat lists indexed by node id; node 0 is the root.
+    Node k holds points idx[start[k]:end[k]] within bounding box
+    [lo[k], hi[k]]. Internal nodes split on the widest box dimension at
+    the median, leaves hold at most leafSize points; left[k] is -1 for
+    leaves.
+
+    >>> pts = np.array([[0, 0], [1, 0], [5, 5], [6, 5], [0, 1]])
+    >>> T = KDTree(pts, leafSize=1)
+    >>> T.query([3, 0], k=2)
+    ([2.0, 3.0], [1, 0])
+    >>> T.query([6, 8])
+    ([3.0], [3])
+    >>> T.query([6, 8], skip=3)
+    ([3.1622776601683795], [2])
+    """
+    def __init__(self, points, leafSize=16):
+        self.data = np.asarray(points, dtype=float)
+        if self.data.ndim != 2:
+            raise ValueError('points must be an (n, d) array')
+        self.leafSize = leafSize
+        self.idx = np.arange(len(self.data))
+        self.start = []; self.end = []
+        self.left = []; self.right = []
+        self.lo = []; self.hi = []
+        if len(self.data):
+            self._build(0, len(self.data))
+
+    def _build(self, start, end):
+        "Builds the node for idx[start:end] and returns its id"
+        node = len(self.start)
+        pts = self.data[self.idx[start:end]]
+        self.start.append(start); self.end.append(end)
+        self.lo.append(pts.min(axis=0)); self.hi.append(pts.max(axis=0))
+        self.left.append(-1); self.right.append(-1)
+        if end - start > self.leafSize:
+            dim = int(np.argmax(self.hi[node] - self.lo[node]))
+            mid = (end - start) // 2
+            order = np.argpartition(pts[:, dim], mid)
+            self.idx[start:end] = self.idx[start:end][order]
+            self.left[node] = self._build(start, start + mid)
+            self.right[node] = self._build(start + mid, end)
+        return node
+
+    @property
+    def numNodes(self):
+        return len(self.start)
+
+    def boxDist2(self, node, x):
+        "Squared distance from point x to the bounding box of node"
+        gap = np.maximum(self.lo[node] - x, 0) + np.maximum(x - self.hi[node], 0)
+        return float(np.dot(gap, gap))
+
+    def query(self, x, k=1, skip=None):
+        """Returns (dists, indices) of the k points nearest to x, closest
+        first. If skip is given, the point with that index is ignored
+        (used to query neighbours of a point of the set itself)."""
+        x = np.asarray(x, dtype=float)
+        best = []          # max-heap of (-dist2, index)
+        if not self.start:
+            return [], []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if len(best) == k and self.boxDist2(node, x) >= -best[0][0]:
+                continue
+            if self.left[node] < 0:
+                ids = self.idx[self.start[node]:self.end[node]]
+                diff = self.data[ids] - x
+                d2 = np.einsum('ij,ij->i', diff, diff)
+                for i, d in zip(ids.tolist(), d2.tolist()):
+                    if i == skip:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, i))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, i))
+            else:
+                # Visit the nearer child first
+                l, r = self.left[node], self.right[node]
+                if self.boxDist2(l, x) <= self.boxDist2(r, x):
+                    stack.append(r); stack.append(l)
+                else:
+                    stack.append(l); stack.append(r)
+        best.sort(reverse=True)
+        return [float(np.sqrt(-d)) for d, _ in best], [i for _, i in best]
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -123,6 +123,124 @@ def BellmanFord(G, start):
             return None, None
     return Acur, P
 
+def _topoOrder(G):
+    """Kahn's topological sort over G.getCSR(). Returns (order, indptr,
+    heads, edgeIdx), or raises ValueError if G has a cycle."""
+    indptr, heads, edgeIdx = G.getCSR()
+    indeg = [0] * G.numVerts
+    for w in heads:
+        indeg[w] += 1
+    order = [v for v in xrange(G.numVerts) if indeg[v] == 0]
+    # order grows while it is being scanned
+    for v in order:
+        for pos in xrange(indptr[v], indptr[v+1]):
+            w = heads[pos]
+            indeg[w] -= 1
+            if indeg[w] == 0:
+                order.append(w)
+    if len(order) < G.numVerts:
+        raise ValueError('Graph is not a DAG: %d vertices are on or behind'
+                         ' a cycle' % (G.numVerts - len(order)))
+    return order, indptr, heads, edgeIdx
+
+
+def DAGPath(G, start, longest=False):
+    """SSSP Algorithm for directed acyclic graphs
+
+    Relaxes the out-edges of every vertex in topological order, so each
+    edge is looked at once: O(n + m). Negative edge weights are fine
+    and with longest=True the longest paths are found instead (negate
+    the weights, find shortest paths, negate back). Returns (A, P) like
+    Dijkstra; unreachable vertices keep inf (-inf if longest).
+
+    Raises ValueError if G has a cycle, before any relaxation.
+
+    >>> G = Graph.loadFromFile('g0nn.txt', True)
+    >>> DAGPath(G, 0)
+    ([0, 3, 1, 3, 6], [-1, 2, 0, 2, 1])
+    >>> DAGPath(G, 0, longest=True)
+    ([0, 4, 1, 3, 7], [-1, 0, 0, 2, 1])
+    >>> DAGPath(G, 2)
+    ([inf, 2, 0, 2, 5], [-1, 2, -1, 2, 1])
+    >>> G.addEdge(1, 3, -4)
+    >>> DAGPath(G, 0)
+    ([0, 3, 1, -1, 2], [-1, 2, 0, 1, 3])
+    >>> DAGPath(Graph.loadFromFile('g0.txt', True), 0)
+    Traceback (most recent call last):
+        ...
+    ValueError: Graph is not a DAG: 4 vertices are on or behind a cycle
+    """
+    order, indptr, heads, edgeIdx = _topoOrder(G)
+    sign = -1 if longest else 1
+    costs = [sign * G.getEdgeCost(eIdx) for eIdx in edgeIdx]
+    inf = float('inf')
+    A = [inf for _ in xrange(G.numVerts)]
+    P = [-1 for _ in xrange(G.numVerts)]
+    A[start] = 0
+    for v in order:
+        Av = A[v]
+        if Av == inf:
+            continue
+        for pos in xrange(indptr[v], indptr[v+1]):
+            w = heads[pos]
+            pathlen = Av + costs[pos]
+            if pathlen < A[w]:
+                A[w] = pathlen
+                P[w] = v
+    if longest:
+        A = [-a if a != inf else -inf for a in A]
+    return A, P
+
+
+def CriticalPath(G):
+    """Critical path analysis of a DAG whose edge costs are durations
+
+    Every vertex without in-edges starts at time 0. The earliest time
+    E[v] of a vertex is the longest path to it, the project length is
+    the largest E[v], and the latest time L[v] is the project length
+    minus the longest path from v to a vertex without out-edges. The
+    slack L[v] - E[v] tells how much v may be delayed without delaying
+    the project; vertices on a critical path have slack 0. Both passes
+    relax edges in topological order: O(n + m).
+
+    Returns (Length, Slack, Path): the project length, the slack of
+    every vertex and one critical path as a list of vertices. Raises
+    ValueError if G has a cycle.
+
+    >>> G = Graph.loadFromFile('g0nn.txt', True)
+    >>> CriticalPath(G)
+    (7, [0, 0, 1, 1, 0], [0, 1, 4])
+    """
+    order, indptr, heads, edgeIdx = _topoOrder(G)
+    costs = [G.getEdgeCost(eIdx) for eIdx in edgeIdx]
+    if not order:
+        return 0, [], []
+    # Earliest times, P points to the predecessor on a longest path
+    E = [None for _ in xrange(G.numVerts)]
+    P = [-1 for _ in xrange(G.numVerts)]
+    for v in order:
+        if E[v] is None:
+            E[v] = 0
+        for pos in xrange(indptr[v], indptr[v+1]):
+            w = heads[pos]
+            t = E[v] + costs[pos]
+            if E[w] is None or t > E[w]:
+                E[w] = t
+                P[w] = v
+    Length = max(E)
+    # Latest times, scanning in reverse topological order
+    L = [Length for _ in xrange(G.numVerts)]
+    for v in reversed(order):
+        if indptr[v] < indptr[v+1]:
+            L[v] = min(L[heads[pos]] - costs[pos]
+                       for pos in xrange(indptr[v], indptr[v+1]))
+    Slack = [L[v] - E[v] for v in xrange(G.numVerts)]
+    Path = [E.index(Length)]
+    while P[Path[-1]] >= 0:
+        Path.append(P[Path[-1]])
+    Path.reverse()
+    return Length, Slack, Path
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
@@ -6,17 +6,38 @@ Traveling salesman problem takes a complete undirected graph
 with non-negative edges as inputs and returns a minimum-cost
 tour.
 """
+import math, os, time, heapq, collections, multiprocessing
 import numpy as np
 import itertools as it
+from util import UnionFind
+from spatial import KDTree
 
-def BruteForce(G):
+def BruteForce(G, prune=False, processes=None):
     """Examines all n! permutations of the vertices to find the
     minimum-cost tour.
 
     G : n x n matrix containing distances between any two vertices.
+    prune : if True, enumerate tours depth first instead (see below)
+    processes : worker processes for prune=True; None uses all cores,
+                1 runs in the calling process
     
     Returns (Cost, Path), where Cost is the cost of the minimal
     tour and Path is the list of vertices visited.
+
+    With prune=True partial tours are extended one vertex at a time,
+    nearest first, with their cost kept incrementally. A partial tour
+    is dropped as soon as its cost plus the cheapest edge into every
+    vertex still to be entered (0 included) exceeds the best complete
+    tour seen so far (seeded with a nearest neighbour tour). For a
+    symmetric G only tours visiting vertex 1 before vertex 2 are
+    searched: a partial tour is dropped when 2 is appended before 1,
+    which cuts the mirror images near the root. The subtrees below
+    each prefix (0, a, b) run in a process pool sharing the best cost.
+    Ties are broken towards the lexicographically smallest such Path,
+    so the result does not depend on the number of processes. 13
+    random Euclidean cities take under a second on one core (about
+    2 minutes with mirrors rejected only at complete tours and no
+    bound).
     
     >>> G = np.zeros(shape=(4, 4))
     >>> G[0,1] = 20; G[1,0] = 20
@@ -27,7 +48,13 @@ def BruteForce(G):
     >>> G[2,3] = 12; G[3,2] = 12
     >>> BruteForce(G)
     (97.0, (0, 1, 2, 3, 0))
+    >>> BruteForce(G, prune=True, processes=1)
+    (97.0, (0, 1, 2, 3, 0))
+    >>> BruteForce(G, prune=True, processes=2)
+    (97.0, (0, 1, 2, 3, 0))
     """
+    if prune and G.shape[0] > 3:
+        return _bruteForcePruned(G, processes)
     numVerts = G.shape[0]
     Cost = float('inf')
     Path = []
@@ -41,10 +68,133 @@ def BruteForce(G):
             Path = (0,) + perm + (0,)
     return Cost, Path
 
-def DynProg(G):
-    """Recursively computes (with memoization) optimal solutions
-    in terms of optimal solutions of smaller problems where the
-    number of vertices participating in the tour is one smaller.
+def _bruteForcePruned(G, processes):
+    "Depth first, pruned and parallel enumeration for BruteForce"
+    numVerts = G.shape[0]
+    D = np.asarray(G, dtype=float)
+    symmetric = bool((D == D.T).all())
+    # Nearest neighbour tour as the first incumbent
+    Path = [0]
+    left = set(range(1, numVerts))
+    while left:
+        nxt = min(left, key=lambda v: D[Path[-1], v])
+        Path.append(nxt)
+        left.remove(nxt)
+    if symmetric and Path.index(2) < Path.index(1):
+        Path = Path[:1] + Path[:0:-1]
+    Path = tuple(Path) + (0,)
+    Cost = _tourCost(D, None, Path)
+    best = multiprocessing.Value('d', Cost)
+    prefixes = [(0, a, b) for a in xrange(1, numVerts)
+                for b in xrange(1, numVerts) if a != b]
+    if symmetric:
+        prefixes = [p for p in prefixes
+                    if p[1] != 2 and (p[2] != 2 or p[1] == 1)]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, _bfInit,
+                                    (D.tolist(), symmetric, best))
+        results = pool.imap_unordered(_bfSearch, prefixes)
+    else:
+        _bfInit(D.tolist(), symmetric, best)
+        results = it.imap(_bfSearch, prefixes)
+    try:
+        for subCost, subPath in results:
+            if (subCost, subPath) < (Cost, Path):
+                Cost, Path = subCost, subPath
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return Cost, Path
+
+_bf = {}
+
+def _bfInit(rows, symmetric, best):
+    "Pool initializer for _bfSearch"
+    n = len(rows)
+    _bf['rows'] = rows
+    _bf['symmetric'] = symmetric
+    _bf['best'] = best
+    # Cheapest edge into each vertex, for the lower bound
+    _bf['minIn'] = [min(rows[x][w] for x in xrange(n) if x != w)
+                    for w in xrange(n)]
+    # Successors of each vertex, nearest first
+    _bf['nearest'] = [sorted(xrange(1, n), key=rows[v].__getitem__)
+                      for v in xrange(n)]
+
+def _bfSearch(prefix):
+    """Enumerates tours starting with prefix, pruning partial tours whose
+    lower bound exceeds the shared best. Returns (Cost, Path) of the
+    best tour found, or (inf, None)."""
+    rows = _bf['rows']
+    shared = _bf['best']
+    minIn = _bf['minIn']
+    nearest = _bf['nearest']
+    n = len(rows)
+    # Vertex 2 may only follow vertex 1 for a symmetric G
+    mirror = 2 if _bf['symmetric'] else -1
+    path = list(prefix)
+    used = [False] * n
+    for v in prefix:
+        used[v] = True
+    found = [float('inf'), None]
+
+    def extend(last, cost, rest, depth):
+        # rest: cheapest edges into the vertices still to be entered,
+        # shrunk a little so that rounding never cuts an optimal tour
+        if cost + rest * 0.999999999 > shared.value:
+            return
+        if depth == n:
+            total = cost + rows[last][0]
+            tour = tuple(path) + (0,)
+            if (total, tour) < tuple(found):
+                found[0], found[1] = total, tour
+                with shared.get_lock():
+                    if total < shared.value:
+                        shared.value = total
+            return
+        row = rows[last]
+        for v in nearest[last]:
+            if not used[v] and (v != mirror or used[1]):
+                used[v] = True
+                path.append(v)
+                extend(v, cost + row[v], rest - minIn[v], depth + 1)
+                path.pop()
+                used[v] = False
+
+    rest = minIn[0] + sum(minIn[v] for v in xrange(1, n) if not used[v])
+    extend(prefix[-1], rows[0][prefix[1]] + rows[prefix[1]][prefix[2]],
+           rest, 3)
+    return found[0], found[1]
+
+def DynProg(G, dtype=np.float64, maxBytes=2**32, chunkRows=1<<16,
+            checkpointDir=None):
+    """Held-Karp dynamic programming over subsets of vertices.
+
+    A[S, j] is the cost of the cheapest path that starts at vertex 0,
+    visits exactly the vertices in S (a subset of 1..n-1 stored as a
+    bitmask, vertex v is bit v-1) and ends at j in S. It is computed
+    from subsets one vertex smaller:
+    A[S, j] = min over k in S-{j} of A[S-{j}, k] + G[k, j].
+
+    G : n x n matrix containing distances between any two vertices.
+    dtype : float type of the [2^(n-1), n-1] cost table; float32
+            halves the memory
+    maxBytes : MemoryError is raised if the cost and parent tables
+               plus the working arrays need more than this
+    chunkRows : number of subsets relaxed per vectorized step, which
+                bounds the temporary arrays to chunkRows x (n-1)
+    checkpointDir : if given, every completed layer is saved to this
+                    (existing) directory so that resumeDynProg can
+                    continue an interrupted run
+
+    Each subset size is one layer, relaxed with NumPy min/argmin over
+    all predecessors k at once. An int8 parent table records the
+    argmin for the tour reconstruction. n = 25 needs about 2 GB with
+    float32.
 
     Returns (Cost, Path), where Cost is the cost of the minimal
     tour and Path is the list of vertices visited.
@@ -57,41 +207,630 @@ def DynProg(G):
     >>> G[1,3] = 34; G[3,1] = 34
     >>> G[2,3] = 12; G[3,2] = 12
     >>> DynProg(G)
-    m: 2
-    m: 3
-    m: 4
-    97.0
+    (97.0, (0, 3, 2, 1, 0))
+    >>> DynProg(G, dtype=np.float32)
+    (97.0, (0, 3, 2, 1, 0))
+    >>> DynProg(G, maxBytes=100)
+    Traceback (most recent call last):
+        ...
+    MemoryError: Held-Karp needs 784 bytes (maxBytes=100)
     """
+    return _heldKarp(G, dtype, maxBytes, chunkRows, checkpointDir, 1)
+
+def resumeDynProg(checkpointDir, maxBytes=2**32, chunkRows=1<<16):
+    """Continues a DynProg run from the last layer saved in
+    checkpointDir. The distance matrix and dtype are read back from the
+    checkpoint, so only the directory is needed.
+
+    Returns (Cost, Path) like DynProg.
+
+    >>> import shutil, tempfile
+    >>> G = np.array([[0, 20, 42, 35], [20, 0, 30, 34],
+    ...               [42, 30, 0, 12], [35, 34, 12, 0]])
+    >>> tmp = tempfile.mkdtemp()
+    >>> DynProg(G, checkpointDir=tmp)
+    (97.0, (0, 3, 2, 1, 0))
+    >>> sorted(os.listdir(tmp))
+    ['dynprog.npz', 'layer02.npz', 'layer03.npz']
+    >>> os.remove(os.path.join(tmp, 'layer03.npz'))
+    >>> _atomicSave(os.path.join(tmp, 'dynprog.npz'), G=G,
+    ...             dtype=np.array('float64'), layer=np.array(2))
+    >>> resumeDynProg(tmp)
+    (97.0, (0, 3, 2, 1, 0))
+    >>> shutil.rmtree(tmp)
+    """
+    with np.load(os.path.join(checkpointDir, 'dynprog.npz')) as meta:
+        G = meta['G']
+        dtype = np.dtype(str(meta['dtype']))
+        done = int(meta['layer'])
+    return _heldKarp(G, dtype, maxBytes, chunkRows, checkpointDir, done)
+
+def _atomicSave(path, **arrays):
+    "np.savez to a temporary file renamed over path once complete"
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp, path)
+
+def _heldKarp(G, dtype, maxBytes, chunkRows, checkpointDir, done):
+    """DynProg with the layers 2..done read from checkpointDir instead
+    of being computed (done=1 starts from scratch)"""
     numVerts = G.shape[0]
-    V = range(numVerts)
-    # A 2-D array indexed by S (a subset of vertices) that
-    # contain vertex 0 and destinations j.
-    A = {}
-    # Iterate by number of verts in a subset
-    for m in xrange(2, numVerts+1):
-        print "m:", m
-        # Do not include vertex 0 in S for now
-        for S in it.combinations(V[1:], m-1):
-            A[(0,)+S] = np.zeros(numVerts)
-            for jIdx, j in enumerate(S):
-                # Base case (k == 0)
-                if len(S) == 1:
-                    curMin = G[0, j]
-                else:
-                    curMin = float('inf')
-                # k != 0
-                Sj = S[:jIdx] + S[jIdx+1:]  # S - {j}
-                for k in Sj:
-                    val = prevA[(0,)+Sj][k] + G[k, j]
-                    curMin = min(curMin, val)
-                A[(0,)+S][j] = curMin
-        #print A
-        prevA = A
-        A = {}
+    if numVerts == 1:
+        return 0.0, (0, 0)
+    m = numVerts - 1
+    numSets = 1 << m
+    needed = _heldKarpBytes(m, np.dtype(dtype).itemsize, chunkRows,
+                            checkpointDir is not None)
+    if needed > maxBytes:
+        raise MemoryError('Held-Karp needs %d bytes (maxBytes=%d)'
+                          % (needed, maxBytes))
+    D = np.asarray(G, dtype=dtype)
+    A = np.full((numSets, m), np.inf, dtype=dtype)
+    Parent = np.full((numSets, m), -1, dtype=np.int8)
+    # Base case: paths 0 -> j
+    for j in xrange(m):
+        A[1 << j, j] = D[0, j+1]
+    # Subset sizes (popcounts) by doubling: the upper half of the
+    # masks below 2^(b+1) has bit b set
+    sizes = np.zeros(1, dtype=np.int8)
+    for b in xrange(m):
+        sizes = np.concatenate((sizes, sizes + 1))
+    if checkpointDir is not None and done == 1:
+        _atomicSave(os.path.join(checkpointDir, 'dynprog.npz'), G=G,
+                    dtype=np.array(np.dtype(dtype).name), layer=np.array(1))
+    for size in xrange(2, m+1):
+        # int32 masks are enough for the n <= 32 that fit in memory
+        layer = np.flatnonzero(sizes == size).astype(np.int32)
+        if size <= done:
+            path = os.path.join(checkpointDir, 'layer%02d.npz' % size)
+            with np.load(path) as saved:
+                A[layer] = saved['A']
+                Parent[layer] = saved['Parent']
+            continue
+        _relaxLayer(A, Parent, D, layer, m, chunkRows)
+        if checkpointDir is not None:
+            # Layer file first, so the meta file never points past it
+            _atomicSave(os.path.join(checkpointDir, 'layer%02d.npz' % size),
+                        A=A[layer], Parent=Parent[layer])
+            _atomicSave(os.path.join(checkpointDir, 'dynprog.npz'), G=G,
+                        dtype=np.array(np.dtype(dtype).name),
+                        layer=np.array(size))
     # Complete the tour and find min
-    Av = prevA[tuple(V)]
-    return min([Av[j] + G[j,0] for j in range(len(Av)) if j != 0])
-    
+    full = numSets - 1
+    j = int(np.argmin(A[full] + D[1:, 0]))
+    tour = []
+    S = full
+    while j >= 0:
+        tour.append(j + 1)
+        prev = int(Parent[S, j])
+        S ^= 1 << j
+        j = prev
+    Path = (0,) + tuple(reversed(tour)) + (0,)
+    Cost = float(sum(G[Path[i], Path[i+1]] for i in xrange(numVerts)))
+    return Cost, Path
+
+def _heldKarpBytes(m, itemsize, chunkRows, checkpoint):
+    """Peak bytes _heldKarp allocates for m = n-1: the cost and parent
+    tables, the popcount table and a comparison against it, the index
+    arrays of the largest layer with _relaxLayer's temporaries, and
+    the arrays of two consecutive chunks (plus the copies of a saved
+    layer)"""
+    numSets = 1 << m
+    maxLayer = math.factorial(m) // (math.factorial(m // 2) *
+                                     math.factorial(m - m // 2))
+    chunk = min(chunkRows, maxLayer)
+    needed = numSets * m * (itemsize + 1)
+    needed += 2 * numSets
+    needed += 16 * maxLayer
+    # vals of the previous chunk stay alive while the next is built;
+    # fancy indexing converts the int32 index arrays to int64
+    needed += chunk * (3 * m * itemsize + 2 * itemsize + 80)
+    if checkpoint:
+        needed += maxLayer * m * (itemsize + 1)
+    return needed
+
+def _relaxLayer(A, Parent, D, layer, m, chunkRows):
+    "Fills A and Parent for the subsets in layer (all of one size)"
+    Dk = D[1:, 1:]     # Dk[k, j] = cost from vertex k+1 to vertex j+1
+    for j in xrange(m):
+        S = layer[(layer >> j) & 1 == 1]
+        for lo in xrange(0, len(S), chunkRows):
+            Sc = S[lo:lo+chunkRows]
+            # Entries A[S-{j}, k] are inf for k outside S-{j}
+            vals = A[Sc ^ (1 << j)] + Dk[:, j]
+            k = vals.argmin(axis=1)
+            A[Sc, j] = vals[np.arange(len(Sc)), k]
+            Parent[Sc, j] = k
+
+def LocalSearch(G=None, coords=None, init='nn', numNeighbors=8,
+                timeLimit=None):
+    """Heuristic tour by construction plus 2-opt and Or-opt improvement.
+
+    G : n x n symmetric matrix containing distances between any two
+        vertices (ValueError is raised otherwise, the move deltas
+        assume G[a, b] == G[b, a]), or
+    coords : (n, d) array of city coordinates (Euclidean distances),
+             which avoids the n x n matrix for thousands of cities.
+    init : initial tour, 'nn' (nearest neighbour) or 'greedy' (greedy
+           edge matching)
+    numNeighbors : size of each city's candidate list (k nearest)
+    timeLimit : seconds to spend improving; None runs to a local optimum
+
+    Improvement only looks at moves that add an edge from a city to one
+    of its candidates. Cities are kept in a queue and a city leaves it
+    (its don't-look bit is set) once no move around it improves the
+    tour; the endpoints of every applied move re-enter the queue.
+    2-opt reverses the shorter side of the tour, Or-opt moves a segment
+    of 1 to 3 cities next to a candidate, possibly reversed. The tour
+    cost is updated by each move's delta instead of being re-summed.
+
+    Returns (Cost, Path) like BruteForce. When timeLimit runs out the
+    best tour so far is returned.
+
+    >>> G = np.zeros(shape=(4, 4))
+    >>> G[0,1] = 20; G[1,0] = 20
+    >>> G[0,2] = 42; G[2,0] = 42
+    >>> G[0,3] = 35; G[3,0] = 35
+    >>> G[1,2] = 30; G[2,1] = 30
+    >>> G[1,3] = 34; G[3,1] = 34
+    >>> G[2,3] = 12; G[3,2] = 12
+    >>> LocalSearch(G)
+    (97.0, (0, 1, 2, 3, 0))
+    >>> pts = np.array([[0, 0], [2, 2], [0, 2], [2, 0], [1, 3]])
+    >>> LocalSearch(coords=pts, init='greedy')
+    (8.82842712474619, (0, 3, 1, 4, 2, 0))
+    >>> G[0,1] = 21
+    >>> LocalSearch(G)
+    Traceback (most recent call last):
+        ...
+    ValueError: LocalSearch needs a symmetric G
+    """
+    if G is not None:
+        if not (G == G.T).all():
+            raise ValueError('LocalSearch needs a symmetric G')
+        n = G.shape[0]
+    else:
+        coords = np.asarray(coords, dtype=float)
+        n = len(coords)
+    if n <= 3:
+        Path = (0,) + tuple(range(1, n)) + (0,)
+        return _tourCost(G, coords, Path), Path
+    started = time.time()
+    dist, rowDist = _distanceFuncs(G, coords)
+    neighbors = _neighborLists(G, coords, min(numNeighbors, n-1))
+    if init == 'nn':
+        tour = _nearestNeighborTour(n, neighbors, rowDist)
+    elif init == 'greedy':
+        tour = _greedyTour(n, neighbors, dist, rowDist)
+    else:
+        raise ValueError('Unknown init: %r' % (init,))
+    pos = [0] * n
+    for i, c in enumerate(tour):
+        pos[c] = i
+    Cost = sum(dist(tour[i-1], tour[i]) for i in xrange(n))
+    eps = 1e-10
+
+    def succ(c):
+        i = pos[c] + 1
+        return tour[0] if i == n else tour[i]
+
+    def pred(c):
+        return tour[pos[c] - 1]
+
+    def reversePath(b, c):
+        "Reverses the tour path from city b forward to city c"
+        i = pos[b]; j = pos[c]
+        length = (j - i) % n + 1
+        if 2 * length > n:
+            # Reversing the rest of the tour gives the same cycle
+            i, j = (j + 1) % n, (i - 1) % n
+            length = n - length
+        for _ in xrange(length // 2):
+            ci = tour[i]; cj = tour[j]
+            tour[i] = cj; pos[cj] = i
+            tour[j] = ci; pos[ci] = j
+            i += 1
+            if i == n: i = 0
+            j -= 1
+            if j < 0: j = n - 1
+
+    def exchange(a, b, c, d):
+        """Replaces tour edges (a,b) and (c,d) with (a,c) and (b,d).
+        (a,b) and (c,d) must point the same way along the tour."""
+        if succ(a) == b:
+            reversePath(b, c)
+        else:
+            reversePath(a, d)
+
+    queue = collections.deque(xrange(n))
+    queued = bytearray([1]) * n
+    def activate(*cities):
+        for c in cities:
+            if not queued[c]:
+                queued[c] = 1
+                queue.append(c)
+
+    def twoOpt(a):
+        for forward in (True, False):
+            b = succ(a) if forward else pred(a)
+            dab = dist(a, b)
+            for c in neighbors[a]:
+                dac = dist(a, c)
+                if dac >= dab:
+                    break
+                d = succ(c) if forward else pred(c)
+                if c == b or d == a:
+                    continue
+                delta = dac + dist(b, d) - dab - dist(c, d)
+                if delta < -eps:
+                    exchange(a, b, c, d)
+                    activate(a, b, c, d)
+                    return delta
+        return 0
+
+    def orOpt(s1):
+        for length in (1, 2, 3):
+            s2 = s1
+            for _ in xrange(length - 1):
+                s2 = succ(s2)
+            p = pred(s1); nx = succ(s2)
+            segment = set([s1, s2, succ(s1)]) if length == 3 else set([s1, s2])
+            if p in segment or nx in segment:
+                return 0
+            removed = dist(p, s1) + dist(s2, nx) - dist(p, nx)
+            for end in (s1, s2):
+                for c in neighbors[end]:
+                    if dist(end, c) >= removed:
+                        break
+                    if c in segment:
+                        continue
+                    for c1, e1 in ((c, succ(c)), (pred(c), c)):
+                        if (e1 in segment or c1 in segment or
+                                c1 == nx or e1 == p):
+                            continue
+                        dce = dist(c1, e1)
+                        rev = dist(c1, s2) + dist(s1, e1) - dce
+                        fwd = dist(c1, s1) + dist(s2, e1) - dce
+                        if min(rev, fwd) - removed < -eps:
+                            exchange(p, s1, c1, e1)
+                            exchange(p, c1, nx, s2)
+                            if fwd < rev:
+                                exchange(c1, s2, s1, e1)
+                            activate(p, nx, s1, s2, c1, e1)
+                            return min(rev, fwd) - removed
+        return 0
+
+    steps = 0
+    while queue:
+        if timeLimit is not None:
+            steps += 1
+            if steps % 64 == 0 and time.time() - started > timeLimit:
+                break
+        a = queue.popleft()
+        queued[a] = 0
+        delta = twoOpt(a) or orOpt(a)
+        if delta:
+            Cost += delta
+            activate(a)
+
+    start = pos[0]
+    Path = tuple(tour[start:] + tour[:start]) + (0,)
+    return Cost, Path
+
+def _tourCost(G, coords, Path):
+    "Sums the cost of the edges of Path"
+    dist, _ = _distanceFuncs(G, coords)
+    return float(sum(dist(Path[i], Path[i+1]) for i in xrange(len(Path)-1)))
+
+def _distanceFuncs(G, coords):
+    """Returns (dist, rowDist): dist(i, j) is a Python float and
+    rowDist(i, js) a NumPy array of the distances from i to cities js"""
+    if G is not None:
+        if G.shape[0] <= 3000:
+            rows = G.tolist()
+            dist = lambda i, j: rows[i][j]
+        else:
+            dist = G.item
+        rowDist = lambda i, js: G[i, js]
+    else:
+        pts = coords.tolist()
+        if coords.shape[1] == 2:
+            xs = [x for x, _ in pts]
+            ys = [y for _, y in pts]
+            hypot = math.hypot
+            dist = lambda i, j: hypot(xs[i] - xs[j], ys[i] - ys[j])
+        else:
+            dist = lambda i, j: math.sqrt(
+                sum((a - b) ** 2 for a, b in zip(pts[i], pts[j])))
+        rowDist = lambda i, js: np.sqrt(((coords[js] - coords[i]) ** 2).sum(axis=1))
+    return dist, rowDist
+
+def _neighborLists(G, coords, k, blockCells=1<<20):
+    """Returns the k nearest other cities of each city, closest first.
+    Rows of G are handled in blocks of about blockCells entries, so the
+    temporaries stay small next to G itself."""
+    if G is not None:
+        n = G.shape[0]
+        near = np.empty((n, k), dtype=np.int64)
+        step = max(1, blockCells // n)
+        for lo in xrange(0, n, step):
+            D = np.array(G[lo:lo+step], dtype=float)
+            rows = np.arange(len(D))
+            D[rows, rows + lo] = np.inf
+            part = np.argpartition(D, k-1, axis=1)[:, :k]
+            rows = rows[:, None]
+            order = np.argsort(D[rows, part], axis=1)
+            near[lo:lo+len(D)] = part[rows, order]
+        return near.tolist()
+    T = KDTree(coords)
+    return [T.query(coords[i], k, skip=i)[1] for i in xrange(len(coords))]
+
+def _nearestNeighborTour(n, neighbors, rowDist):
+    "Nearest neighbour tour from city 0"
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    tour = [0]
+    cur = 0
+    for _ in xrange(n - 1):
+        nxt = -1
+        for c in neighbors[cur]:
+            if not visited[c]:
+                nxt = c
+                break
+        if nxt < 0:
+            # All candidates used up; scan the unvisited cities
+            rest = np.nonzero(~visited)[0]
+            nxt = int(rest[np.argmin(rowDist(cur, rest))])
+        visited[nxt] = True
+        tour.append(nxt)
+        cur = nxt
+    return tour
+
+def _greedyTour(n, neighbors, dist, rowDist):
+    """Greedy edge tour: candidate edges are taken shortest first when
+    both ends have degree < 2 and no cycle forms; the resulting paths
+    are then chained nearest endpoint first."""
+    edges = sorted((dist(a, b), a, b) for a in xrange(n)
+                   for b in neighbors[a] if a < b or a not in neighbors[b])
+    uf = UnionFind(n)
+    adj = [[] for _ in xrange(n)]
+    for _, a, b in edges:
+        if len(adj[a]) < 2 and len(adj[b]) < 2 and uf.find(a) != uf.find(b):
+            uf.union(a, b)
+            adj[a].append(b)
+            adj[b].append(a)
+    isEnd = np.array([len(adj[c]) < 2 for c in xrange(n)])
+    visited = np.zeros(n, dtype=bool)
+    tour = []
+    cur = int(np.nonzero(isEnd)[0][0])
+    while True:
+        # Walk the path starting at endpoint cur
+        prev = -1
+        while True:
+            tour.append(cur)
+            visited[cur] = True
+            nxt = [c for c in adj[cur] if c != prev]
+            if not nxt:
+                break
+            prev, cur = cur, nxt[0]
+        ends = np.nonzero(isEnd & ~visited)[0]
+        if not len(ends):
+            break
+        cur = int(ends[np.argmin(rowDist(cur, ends))])
+    return tour
+
+def BranchAndBound(G, processes=None, depth=2, iterations=10,
+                   report=None):
+    """Exact TSP by depth first branch and bound over partial tours.
+
+    G : n x n symmetric matrix of distances between any two vertices;
+        ValueError is raised otherwise, as the bound and the mirror
+        pruning are only valid for symmetric costs.
+    processes : worker processes; None uses all cores, 1 runs inline
+    depth : number of vertices after 0 fixed in the top level
+            subproblems handed to the workers
+    iterations : subgradient steps per node for the lower bound
+    report : optional callable report(nodes, nodesPerSec, gap) called
+             as subproblems finish, gap being (best - lower) / best
+             with lower the smallest bound among the top level
+             subproblems still outstanding (or best once none is
+             left, so the gap reaches 0 when optimality is proven)
+
+    A node is a path from vertex 0 to some vertex 'last'; the rest of
+    the tour is a path from last through the unvisited vertices U back
+    to 0. Its lower bound is the Held-Karp Lagrangian relaxation of
+    that path: a spanning tree of U plus the cheapest edge last -> U
+    and the cheapest edge U -> 0, with vertex penalties pi adjusted by
+    subgradient steps towards degree 2 (the 1-tree bound of the whole
+    tour at the root). Penalties are inherited by the children. Only
+    tours whose second vertex is smaller than their last one are
+    searched, which skips mirror images.
+
+    The initial upper bound comes from LocalSearch. The top level
+    subtrees run in a process pool; the incumbent cost lives in a
+    shared multiprocessing.Value so every worker prunes with the best
+    tour found by any of them.
+
+    Returns (Cost, Path) like BruteForce.
+
+    >>> G = np.zeros(shape=(4, 4))
+    >>> G[0,1] = 20; G[1,0] = 20
+    >>> G[0,2] = 42; G[2,0] = 42
+    >>> G[0,3] = 35; G[3,0] = 35
+    >>> G[1,2] = 30; G[2,1] = 30
+    >>> G[1,3] = 34; G[3,1] = 34
+    >>> G[2,3] = 12; G[3,2] = 12
+    >>> BranchAndBound(G, processes=1)
+    (97.0, (0, 1, 2, 3, 0))
+    >>> BranchAndBound(G, processes=2, depth=1)
+    (97.0, (0, 1, 2, 3, 0))
+    >>> gaps = []
+    >>> BranchAndBound(G, processes=1, report=lambda *r: gaps.append(r[2]))
+    (97.0, (0, 1, 2, 3, 0))
+    >>> gaps[-1]
+    0.0
+    >>> G[2,3] = 13
+    >>> BranchAndBound(G)
+    Traceback (most recent call last):
+        ...
+    ValueError: BranchAndBound needs a symmetric G
+    """
+    G = np.asarray(G, dtype=float)
+    if not (G == G.T).all():
+        raise ValueError('BranchAndBound needs a symmetric G')
+    n = G.shape[0]
+    if n <= 3:
+        Path = (0,) + tuple(range(1, n)) + (0,)
+        return _tourCost(G, None, Path), Path
+    started = time.time()
+    Cost, Path = LocalSearch(G)
+    U = np.arange(1, n)
+    rootLB, rootPi = _pathBound(G, 0, U, np.zeros(n-1), Cost, 5 * iterations)
+    pi = np.zeros(n)
+    pi[1:] = rootPi
+    best = multiprocessing.Value('d', Cost)
+    depth = max(1, min(depth, n - 3))
+    prefixes = [(0,) + p for p in it.permutations(range(1, n), depth)]
+    args = [(p, pi, iterations) for p in prefixes]
+    if report is not None:
+        # One subgradient step per prefix from the root penalties is a
+        # cheap bound; no tour in a subtree can beat max(root, prefix)
+        pending = []
+        for p in prefixes:
+            cost = sum(G[p[i], p[i+1]] for i in xrange(len(p) - 1))
+            U = np.array([v for v in xrange(n) if v not in p])
+            lb, _ = _pathBound(G, p[-1], U, pi[U], np.inf, 1, p[1])
+            pending.append((max(rootLB, cost + lb), p))
+        heapq.heapify(pending)
+        finished = set()
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, _bbInit, (G, best))
+        results = pool.imap_unordered(_bbSearch, args)
+    else:
+        _bbInit(G, best)
+        results = it.imap(_bbSearch, args)
+    nodes = 0
+    try:
+        for subCost, subPath, subNodes, prefix in results:
+            nodes += subNodes
+            if subCost < Cost:
+                Cost, Path = subCost, subPath
+            if report is not None:
+                finished.add(prefix)
+                while pending and pending[0][1] in finished:
+                    heapq.heappop(pending)
+                lower = min(pending[0][0], Cost) if pending else Cost
+                elapsed = max(time.time() - started, 1e-9)
+                report(nodes, nodes / elapsed, max(0.0, (Cost - lower) / Cost))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return float(Cost), Path
+
+_bb = {}
+
+def _bbInit(G, best):
+    "Pool initializer: shares the distance matrix and incumbent cost"
+    _bb['G'] = G
+    _bb['best'] = best
+
+def _bbSearch(args):
+    """Branch and bound below one prefix path. Returns the best tour
+    found that beats the incumbent as (Cost, Path, nodes, prefix)."""
+    prefix, pi, iterations = args
+    G = _bb['G']
+    shared = _bb['best']
+    n = G.shape[0]
+    bestCost, bestPath = float('inf'), None
+    cost = sum(G[prefix[i], prefix[i+1]] for i in xrange(len(prefix)-1))
+    stack = [(list(prefix), cost, pi)]
+    nodes = 0
+    while stack:
+        path, cost, pi = stack.pop()
+        nodes += 1
+        ub = shared.value
+        if cost >= ub:
+            continue
+        last = path[-1]
+        seen = set(path)
+        U = np.array([v for v in xrange(n) if v not in seen])
+        # Skip mirror images: the tour must end above its second vertex
+        above = path[1]
+        if len(U) == 1:
+            u = U[0]
+            total = cost + G[last, u] + G[u, 0]
+            if u > above and total < ub:
+                with shared.get_lock():
+                    if total < shared.value:
+                        shared.value = total
+                bestCost, bestPath = total, tuple(path) + (u, 0)
+            continue
+        lb, piU = _pathBound(G, last, U, pi[U], ub - cost, iterations, above)
+        if cost + lb >= ub - 1e-9:
+            continue
+        pi = pi.copy()
+        pi[U] = piU
+        # Push farthest first so the nearest child is explored first
+        for u in U[np.argsort(-G[last, U])]:
+            stack.append((path + [int(u)], cost + G[last, u], pi))
+    return bestCost, bestPath, nodes, prefix
+
+def _pathBound(G, last, U, pi, target, iterations, above=-1):
+    """Held-Karp style lower bound on the cheapest path from last
+    through all vertices U ending at 0, through a vertex > above.
+
+    Returns (bound, pi) with the best penalties found. Stops early once
+    the bound reaches target (nothing better can be pruned) or the
+    relaxation is itself a path.
+    """
+    k = len(U)
+    C = G[np.ix_(U, U)]
+    toU = G[last, U]
+    fromU = np.where(U > above, G[U, 0], np.inf)
+    best, bestPi = -np.inf, pi
+    for _ in xrange(iterations):
+        W = C + pi[:, None] + pi[None, :]
+        # Prim's MST over U with penalized costs
+        deg = np.zeros(k, dtype=int)
+        inTree = np.zeros(k, dtype=bool)
+        inTree[0] = True
+        key = W[0].copy()
+        parent = np.zeros(k, dtype=int)
+        total = 0.0
+        for _ in xrange(k - 1):
+            j = int(np.argmin(np.where(inTree, np.inf, key)))
+            total += key[j]
+            deg[j] += 1
+            deg[parent[j]] += 1
+            inTree[j] = True
+            closer = W[j] < key
+            key = np.where(closer, W[j], key)
+            parent = np.where(closer, j, parent)
+        a = toU + pi
+        b = fromU + pi
+        ia = int(np.argmin(a))
+        ib = int(np.argmin(b))
+        if b[ib] == np.inf:
+            return np.inf, pi
+        lb = total + a[ia] + b[ib] - 2 * pi.sum()
+        deg[ia] += 1
+        deg[ib] += 1
+        if lb > best:
+            best, bestPi = lb, pi
+        g = deg - 2
+        norm = (g * g).sum()
+        if best >= target or norm == 0:
+            break
+        step = (target - lb) / norm if target < np.inf else 1.0
+        pi = pi + 0.5 * step * g
+    return best, bestPi
 
 if __name__ == '__main__':
     import doctest
@@ -64,6 +64,175 @@ class UnionFind(object):
         "For debugging"
         return repr(self.asDict())
 
+class RollbackUnionFind(object):
+    """UnionFind that can undo its unions.
+
+    Uses union by rank and no path compression so that every union
+    changes a bounded amount of state which is recorded on a change
+    stack. snapshot() returns a marker into that stack and
+    rollback(marker) undoes all unions made since.
+
+    >>> uf = RollbackUnionFind(5)
+    >>> uf.union(0, 1)
+    True
+    >>> s = uf.snapshot()
+    >>> uf.union(1, 2); uf.union(3, 4)
+    True
+    True
+    >>> uf.union(0, 2)
+    False
+    >>> uf.numSets
+    2
+    >>> uf.connected(0, 2)
+    True
+    >>> uf.rollback(s)
+    >>> uf.numSets
+    4
+    >>> uf.connected(0, 2), uf.connected(0, 1)
+    (False, True)
+    """
+    def __init__(self, numItems):
+        self.items = range(numItems)
+        self.ranks = [0] * numItems
+        self.numSets = numItems
+        self.changes = []   # (child root, parent root, parent rank before)
+
+    def find(self, i):
+        "Returns the set id of an item"
+        items = self.items
+        while items[i] != i:
+            i = items[i]
+        return i
+
+    def connected(self, i, j):
+        "Returns True if item i and j are in the same set"
+        return self.find(i) == self.find(j)
+
+    def union(self, i, j):
+        """Join item i and j into a single set.
+
+        Returns True if two sets were merged and False if i and j
+        were already in the same set (nothing is recorded then).
+        """
+        set_i = self.find(i)
+        set_j = self.find(j)
+        if set_i == set_j:
+            return False
+        if self.ranks[set_i] > self.ranks[set_j]:
+            set_i, set_j = set_j, set_i
+        self.changes.append((set_i, set_j, self.ranks[set_j]))
+        self.items[set_i] = set_j
+        if self.ranks[set_i] == self.ranks[set_j]:
+            self.ranks[set_j] += 1
+        self.numSets -= 1
+        return True
+
+    def snapshot(self):
+        "Returns a marker that can be passed to rollback()"
+        return len(self.changes)
+
+    def rollback(self, snapshot):
+        "Undo all unions made after snapshot was taken"
+        changes = self.changes
+        while len(changes) > snapshot:
+            child, parent, rank = changes.pop()
+            self.items[child] = child
+            self.ranks[parent] = rank
+            self.numSets += 1
+
+    def asDict(self):
+        "Returns content as dictionary"
+        sets = {}
+        for idx in xrange(len(self.items)):
+            sets.setdefault(self.find(idx), []).append(idx)
+        return sets
+
+    def __repr__(self):
+        "For debugging"
+        return repr(self.asDict())
+
+
+def OfflineConnectivity(numItems, log):
+    """Answers connectivity queries over a log of edge insertions and
+    deletions.
+
+    numItems : number of items (vertices)
+    log : list of tuples (op, u, v) where op is one of 'add', 'remove'
+          or 'query'. Edges are undirected; removing an edge that is
+          not present raises KeyError.
+
+    Returns a list of booleans, one for each 'query' entry in the log,
+    telling whether u and v are connected at that point of the log.
+
+    Each edge is alive over an interval of log positions. The intervals
+    are stored in a segment tree over the log; a depth first walk of
+    the tree unions the edges of a node on the way down and rolls them
+    back on the way up, so every query leaf sees exactly the edges alive
+    at its position. Runs in O(m log m log n) for a log of length m.
+
+    >>> log = [('add', 0, 1), ('add', 1, 2), ('query', 0, 2),
+    ...        ('remove', 1, 0), ('query', 0, 2), ('query', 1, 2),
+    ...        ('add', 2, 0), ('query', 0, 1), ('remove', 2, 1),
+    ...        ('query', 1, 2)]
+    >>> OfflineConnectivity(3, log)
+    [True, False, True, True, False]
+    """
+    numOps = len(log)
+    if numOps == 0:
+        return []
+    # Find the [start, end) log interval each edge is alive for.
+    # Duplicate edges are alive independently of each other.
+    alive = {}
+    intervals = []
+    for t, (op, u, v) in enumerate(log):
+        edge = (u, v) if u < v else (v, u)
+        if op == 'add':
+            alive.setdefault(edge, []).append(t)
+        elif op == 'remove':
+            starts = alive.get(edge)
+            if not starts:
+                raise KeyError('No such edge: %s' % (edge,))
+            intervals.append((starts.pop(), t, edge))
+        elif op != 'query':
+            raise ValueError('Invalid operation: %r' % (op,))
+    for edge, starts in alive.items():
+        for start in starts:
+            intervals.append((start, numOps, edge))
+
+    # Segment tree over log positions; node k covers [lo, hi).
+    size = 1
+    while size < numOps:
+        size *= 2
+    tree = [[] for _ in xrange(2 * size)]
+    for start, end, edge in intervals:
+        lo = start + size; hi = end + size
+        while lo < hi:
+            if lo & 1:
+                tree[lo].append(edge); lo += 1
+            if hi & 1:
+                hi -= 1; tree[hi].append(edge)
+            lo //= 2; hi //= 2
+
+    uf = RollbackUnionFind(numItems)
+    answers = []
+    def walk(node, lo, hi):
+        # Nothing to answer past the end of the log
+        if lo >= numOps:
+            return
+        snapshot = uf.snapshot()
+        for u, v in tree[node]:
+            uf.union(u, v)
+        if node >= size:
+            if log[lo][0] == 'query':
+                answers.append(uf.connected(log[lo][1], log[lo][2]))
+        else:
+            mid = (lo + hi) // 2
+            walk(2 * node, lo, mid)
+            walk(2 * node + 1, mid, hi)
+        uf.rollback(snapshot)
+    walk(1, 0, size)
+    return answers
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()